@@ -0,0 +1,124 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from Code.Database import load_bookable_trains, claim_batch, get_schedule_version, today
+from Code.BatchPlanner import plan_batch, greedy_plan, fill_rate, group_size
+
+LOCAL = ZoneInfo("Europe/London")
+
+def format_24_to_12(time_str):
+    return datetime.strptime(time_str, "%H:%M").strftime("%-I:%M %p")
+
+def empty_batch():
+    return pd.DataFrame({"Adults": [0], "Children": [0], "Toddlers": [0], "Wheelchair Users": [0]})
+
+def read_groups(table):
+    groups = []
+    for _, row in table.fillna(0).iterrows():
+        group = {
+            "adults": int(row["Adults"]),
+            "children": int(row["Children"]),
+            "toddlers": int(row["Toddlers"]),
+            "wheelchair_count": int(row["Wheelchair Users"]),
+        }
+        if group_size(group) > 0:
+            groups.append(group)
+    return groups
+
+def batch_booking_page():
+    st.header("👥 Batch Booking")
+    st.caption("Enter a coach party or pre-booked list and place every group together.")
+
+    if "batch_feedback" in st.session_state:
+        booked = st.session_state.pop("batch_feedback")
+        if booked is None:
+            st.error("❌ Some seats were taken by another till, so nothing was booked. Plan the batch again.")
+        else:
+            st.success(f"✅ Booked {booked} group(s).")
+
+    service_date = st.date_input("Service Date", value=today(), min_value=today(), key="batch_service_date")
+    now = datetime.now(LOCAL)
+    from_minute = now.hour * 60 + now.minute if service_date == now.date() else 0
+
+    if "batch_table" not in st.session_state:
+        st.session_state.batch_table = empty_batch()
+
+    table = st.data_editor(
+        st.session_state.batch_table,
+        num_rows="dynamic",
+        column_config={
+            "Adults": st.column_config.NumberColumn(min_value=0, step=1),
+            "Children": st.column_config.NumberColumn(min_value=0, step=1),
+            "Toddlers": st.column_config.NumberColumn(min_value=0, step=1),
+            "Wheelchair Users": st.column_config.NumberColumn(min_value=0, step=1),
+        },
+        key="batch_editor",
+    )
+    groups = read_groups(table)
+
+    if st.button("🧮 Plan Batch", disabled=not groups):
+        schedule = load_bookable_trains(from_minute, service_date)
+        st.session_state.batch_plan = {
+            "groups": groups,
+            "service_date": service_date,
+            "version": get_schedule_version(),
+            "plan": plan_batch(schedule, groups, from_minute),
+            "greedy": greedy_plan(schedule, groups, from_minute),
+        }
+
+    batch = st.session_state.get("batch_plan")
+    if not batch:
+        return
+    if batch["groups"] != groups:
+        st.info("The list has changed since it was planned. Plan it again before booking.")
+        return
+    if batch["service_date"] != service_date or batch["version"] != get_schedule_version():
+        st.info("The schedule has changed since the batch was planned. Plan it again before booking.")
+        return
+
+    plan, greedy = batch["plan"], batch["greedy"]
+    schedule = plan["schedule"]
+
+    rows = []
+    for placement in plan["placements"]:
+        group = groups[placement["group"]]
+        if placement["train_index"] is None:
+            train_time, carriages = "—", "No space"
+        else:
+            train_time = format_24_to_12(schedule[placement["train_index"]]["departure_time"])
+            carriages = ", ".join(c["number"] for c in placement["carriages"])
+        rows.append({
+            "Group": placement["group"] + 1,
+            "People": group_size(group),
+            "Wheelchair": "♿" * group["wheelchair_count"],
+            "Train": train_time,
+            "Carriages": carriages,
+        })
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+
+    # How the joint plan compares with booking the groups one at a time
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Fill rate of trains used", f"{fill_rate(plan):.0%}", f"{fill_rate(plan) - fill_rate(greedy):+.0%} vs one at a time")
+    col2.metric("Empty seats in booked carriages", plan["waste"], plan["waste"] - greedy["waste"], delta_color="inverse")
+    col3.metric("Total wait (person-minutes)", plan["wait"], plan["wait"] - greedy["wait"], delta_color="inverse")
+    if plan["unplaced"]:
+        st.warning(f"🚩 {plan['unplaced']} group(s) could not be placed on any train.")
+
+    if st.button("✅ Book All Groups"):
+        # Every group is booked or none is, so a lost seat never leaves half a party booked
+        bookings = [
+            (groups[placement["group"]], placement["carriages"])
+            for placement in plan["placements"] if placement["train_index"] is not None
+        ]
+        group_ids = claim_batch(bookings)
+
+        del st.session_state.batch_plan
+        if group_ids is None:
+            # Keep the list so it can be planned again
+            st.session_state.batch_feedback = None
+        else:
+            st.session_state.batch_table = empty_batch()
+            st.session_state.pop("batch_editor", None)
+            st.session_state.batch_feedback = len(group_ids)
+        st.rerun()
@@ -1,16 +1,19 @@
 import streamlit as st
-from Code import WC as wc
-from Code.SmallGroup import SmallGroupHandler
-from Code.MediumGroup import MediumGroupHandler
-from Code.LargeGroups import LargeGroupHandler
-from Code.Database import save_schedule, load_schedule, create_tables, create_presets_table, create_notes_table
+from Code.DayAllocator import DaySchedule
+from Code.allocation import (
+    AllocationOptions, propose, apply_placement, plan_rebalance,
+    SMALL_GROUP_LARGER_CARRIAGE, ONLY_PAIR_AVAILABLE, SOON_DEPARTING, MEDIUM_GROUP_PAIR
+)
+from Code.Policy import policy_for
+from Code.Database import (
+    load_bookable_snapshot, create_group, delete_group, peek_next_group_id, claim_carriages,
+    get_groups, rebalance_groups, today
+)
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 LOCAL = ZoneInfo("Europe/London")
 
-now_local = datetime.now(LOCAL)
-
 def format_24_to_12(time_str):
     return parse_time_local(time_str).strftime("%-I:%M %p")
 
@@ -21,102 +24,20 @@ def parse_time_local(time_str):
     )
     return dt
 
-from Code.Utils import only_c4_c5_available, only_c1_c8_available
-
 WARNING_THRESHOLD_MINUTES = 10
+MAX_BOOKING_ATTEMPTS = 3
 
-create_tables()
-create_presets_table()
-create_notes_table()
-
-def minutes_until_departure(dep_time_str):
+def seconds_of_day():
     now = datetime.now(LOCAL)
-    dep_time = parse_time_local(dep_time_str)
-    delta = dep_time - now
-    return int((delta.total_seconds() + 59) // 60)
+    return now.hour * 3600 + now.minute * 60 + now.second
 
-def find_soon_departing_train(schedule):
-    for train in schedule:
-        if train["cancelled"] or train["party_train"] or train["school_name"] != "":
-            continue
-        minutes = minutes_until_departure(train["departure_time"])
-        if 0 <= minutes <= WARNING_THRESHOLD_MINUTES and any(not c["occupied"] for c in train["carriages"]):
-            return train, minutes
-    return None, None
-
-def assign_group(schedule, adults, toddlers, wheelchair_count, group_size, group_id, confirmed=False, restricted_carriages=None):
-    schedule = sorted(schedule, key=lambda x: parse_time_local(x['departure_time']))
-
-    for train_index, train in enumerate(schedule):
-        if train["cancelled"] or train["party_train"] or train["school_name"] != "":
-            continue
-
-        minutes = minutes_until_departure(train["departure_time"])
-        if minutes < 0:
-            continue
-
-        if minutes <= WARNING_THRESHOLD_MINUTES and not confirmed:
-            continue
-
-        # --- Restriction mode for specific carriages ---
-        if restricted_carriages is not None:
-            carriages = [c for c in train["carriages"] if c["number"] in restricted_carriages and not c["occupied"]]
-            total_cap = sum(c["capacity"] for c in carriages)
-
-            if total_cap < group_size:
-                continue
-
-            if wheelchair_count > 0:
-                assigned = wc.WC.wheelchair(wheelchair_count, group_size, adults, toddlers, [train], st, group_id)
-                if assigned:
-                    schedule[train_index] = train
-                    return True, schedule
-                continue
-
-            remaining = group_size
-            per = toddlers // len(carriages)
-            extra = toddlers % len(carriages)
-            for i, c in enumerate(carriages):
-                assign = min(remaining, c["capacity"])
-                tod = per + (1 if i < extra else 0)
-                c.update({"occupied": True, "group_size": assign, "toddlers": tod, "wheelchair": wheelchair_count > 0, "group_id": group_id})
-                remaining -= assign
-                for orig_c in train["carriages"]:
-                    if orig_c["number"] == c["number"]:
-                        orig_c.update(c)
-            schedule[train_index] = train
-            return True, schedule
-
-        # --- Wheelchair logic first if unrestricted ---
-        if wheelchair_count > 0:
-            assigned = wc.WC.wheelchair(wheelchair_count, group_size, adults, toddlers, [train], st, group_id)
-            if assigned:
-                schedule[train_index] = train
-                return True, schedule
-            continue
-
-        # --- Standard group handling using new classes ---
-        handler_class = (
-            SmallGroupHandler if group_size <= 2 else
-            MediumGroupHandler if 3 <= group_size <= 4 else
-            LargeGroupHandler
-        )
-        handler = handler_class(
-            group={"size": group_size, "toddlers": toddlers},
-            adults=adults,
-            carriages=train["carriages"],
-            train=train,
-            st_module=st,
-            group_id=group_id,
-            confirmation_callback=small_group_confirmation
-        )
-
-        assigned = handler.assign()
-        if assigned:
-            schedule[train_index] = train
-            return True, schedule
-
-    return False, schedule
+def load_upcoming_trains():
+    # Only trains still open for booking today, already in departure order
+    service_date = today()
+    now = datetime.now(LOCAL)
+    from_minute = now.hour * 60 + now.minute
+    version, trains = load_bookable_snapshot(from_minute, service_date)
+    return DaySchedule(trains, None if version is None else (version, service_date.isoformat(), from_minute))
 
 def display_assignment_success(schedule, group_id):
     for train in schedule:
@@ -137,118 +58,80 @@ def display_assignment_success(schedule, group_id):
             st.success(f"✅ Assigned to {summary}, {details}{extra_str}")
             break
 
-def group_can_fit_on_train(train, group_size, adults, toddlers, wheelchair_count):
-    carriages = train["carriages"]
-    available_capacity = sum(c["capacity"] for c in carriages if not c["occupied"])
-
-    if wheelchair_count > 0:
-        return wc.WC.can_fit_wheelchair(train, group_size, adults, toddlers, wheelchair_count)
-
-    if group_size in [3, 4] and adults >= 2:
-        c4 = next((c for c in carriages if c["number"] == "4" and not c["occupied"]), None)
-        c5 = next((c for c in carriages if c["number"] == "5" and not c["occupied"]), None)
-        c1 = next((c for c in carriages if c["number"] == "1" and not c["occupied"]), None)
-        c8 = next((c for c in carriages if c["number"] == "8" and not c["occupied"]), None)
-        if c4 and c5:
-            return True
-        elif c1 and c8:
-            return True
-
-    if group_size <= available_capacity:
-        return True
-
-    return False
-
-def small_group_confirmation(train, group_size, carriage):
-    key = f"small_group_confirm_{train['departure_time']}_{carriage['number']}_{group_size}"
-    if key not in st.session_state:
-        st.session_state[key] = None
-
-    if st.session_state[key] is None:
-        st.warning(
-            f"Train at {format_24_to_12(train['departure_time'])} has no free 2-seat carriages.\n"
-            f"Assign your group of {group_size} to larger carriage {carriage['number']} "
-            f"(capacity {carriage['capacity']}) now, or wait for the next train?"
+# What to show staff for each question the allocation engine can ask:
+# (yes button, no button, error if "yes" fails, error if "no" fails)
+QUESTIONS = {
+    SMALL_GROUP_LARGER_CARRIAGE: (
+        "✅ Yes, assign on this train", "❌ No, assign to 2-person carriage",
+        "❌ Could not assign group to this train.", "❌ Could not assign group to this train."
+    ),
+    ONLY_PAIR_AVAILABLE: (
+        None, "❌ No, assign to next available train",
+        "❌ Could not assign group to this train.", "❌ No space on any upcoming train."
+    ),
+    SOON_DEPARTING: (
+        "Assign to this train", "Assign to next available train",
+        "❌ Could not assign group to this train.", "❌ No space on any upcoming train."
+    ),
+    MEDIUM_GROUP_PAIR: (
+        "✅ Assign now", "❌ Wait for next train",
+        "❌ Could not assign group to this train.", "❌ No space on any upcoming train."
+    ),
+}
+
+def question_text(confirmation, train, group_size):
+    departure = format_24_to_12(confirmation.departure_time)
+    if confirmation.question == SMALL_GROUP_LARGER_CARRIAGE:
+        return (
+            f"🚩 Group of {group_size} can be seated in a 4-person carriage "
+            f"on the {departure} train (leaves in {confirmation.minutes} mins). Continue?"
         )
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("✅ Assign now", key=key + "_yes"):
-                st.session_state[key] = True
-                st.rerun()
-        with col2:
-            if st.button("❌ Wait for next train", key=key + "_no"):
-                st.session_state[key] = False
-                st.rerun()
+    if confirmation.question == ONLY_PAIR_AVAILABLE:
+        return (
+            f"🚩 Only space for your group is on carriages {', '.join(confirmation.carriages)} on train at {departure} "
+            f"which leaves in {confirmation.minutes} minutes"
+        )
+    if confirmation.question == SOON_DEPARTING:
+        return f"⚠️ Train at {departure} leaves in {confirmation.minutes} minutes."
+    carriage = next(c for c in train["carriages"] if c["number"] == confirmation.carriages[0])
+    return (
+        f"Train at {departure} has no free 2-seat carriages.\n"
+        f"Assign your group of {group_size} to larger carriage {carriage['number']} "
+        f"(capacity {carriage['capacity']}) now, or wait for the next train?"
+    )
 
-    return st.session_state[key]  # True/False or None if undecided
-
-def assign_to_2cap_only(schedule, adults, toddlers, wheelchair_count, group_size, group_id):
-    if adults < 1:
-        return False, schedule
-
-    for train_index, train in enumerate(schedule):
-        if train["cancelled"] or train["party_train"] or train["school_name"] != "":
-            continue
-        if minutes_until_departure(train["departure_time"]) < 0:
-            continue
-
-        # Only consider small carriages: 1, 4, 5, 8 that are not occupied
-        carriages = [c for c in train["carriages"] if c["number"] in ["1", "4", "5", "8"] and not c["occupied"]]
-        total_cap = sum(c["capacity"] for c in carriages)
-        if total_cap < group_size:
-            continue
-
-        # Assign group to the minimum number of required carriages
-        remaining = group_size
-        used_carriages = []
-        for c in carriages:
-            if remaining <= 0:
-                break
-            assign = min(remaining, c["capacity"])
-            used_carriages.append((c, assign))
-            remaining -= assign
-
-        if remaining > 0:
-            continue  # Not enough capacity in eligible carriages
-
-        # Distribute toddlers among used carriages
-        num_used = len(used_carriages)
-        per = toddlers // num_used if num_used > 0 else 0
-        extra = toddlers % num_used
-
-        for i, (c, assign) in enumerate(used_carriages):
-            tod = per + (1 if i < extra else 0)
-            c.update({
-                "occupied": True,
-                "group_size": assign,
-                "toddlers": tod,
-                "wheelchair": wheelchair_count > 0,
-                "group_id": group_id
-            })
-
-            # Update original carriage in train
-            for orig_c in train["carriages"]:
-                if orig_c["number"] == c["number"]:
-                    orig_c.update(c)
-
-        schedule[train_index] = train
-        return True, schedule
-
-    return False, schedule
+def move_lines(plan, schedule):
+    # One line per group staff need to move, for the offer and the confirmation after
+    lines = []
+    for move in plan.moves:
+        line = (
+            f"Group {move.group_id}: carriages {', '.join(c['number'] for c in move.from_carriages)} → "
+            f"carriages {', '.join(c['number'] for c in move.to_carriages)}"
+        )
+        if move.to_train_index != move.from_train_index:
+            line += f" on the {format_24_to_12(schedule[move.to_train_index]['departure_time'])} train"
+        lines.append(line)
+    return lines
+
+def seats_recovered_text(plan, schedule):
+    return ", ".join(
+        f"{format_24_to_12(schedule[index]['departure_time'])} train {seats:+d} seats"
+        for index, seats in plan.seats_recovered.items()
+    )
 
 def booking_page():
-    if "confirm_c45" not in st.session_state:
-        st.session_state.confirm_c45 = {}
+    if "booking_answers" not in st.session_state:
+        st.session_state.booking_answers = {}
     if "feedback" not in st.session_state:
         st.session_state.feedback = None
-    if "allow_2p_in_4cap_by_group" not in st.session_state:
-        st.session_state.allow_2p_in_4cap_by_group = {}
 
     def display_feedback():
         if st.session_state.feedback:
             if st.session_state.feedback["type"] == "success":
                 updated, gid = st.session_state.feedback["data"]
                 display_assignment_success(updated, gid)
+                for line in st.session_state.feedback.get("moves", []):
+                    st.info(f"🔀 {line}")
             elif st.session_state.feedback["type"] == "error":
                 st.error(st.session_state.feedback["data"])
             st.session_state.feedback = None
@@ -260,227 +143,124 @@ def booking_page():
         st.session_state.adults = 0
         st.session_state.children = 0
         st.session_state.toddlers = 0
-        st.session_state.wheelchair = False
+        st.session_state.wheelchair_count = 0
         st.session_state.reset_form = False
         st.rerun()
 
-    schedule = load_schedule()
     st.header("🎟️ Automatic Group Assignment")
 
     # Input
     adults = st.number_input("Number of Adults", min_value=0, key="adults")
     children = st.number_input("Number of Children", min_value=0, key="children")
     toddlers = st.number_input("Number of Lap-sitting Toddlers", min_value=0, max_value=st.session_state.adults, key="toddlers")
-    wheelchair = st.checkbox("A wheelchair user is in this group", key="wheelchair")
+    wheelchair_count = st.number_input("Number of Wheelchair Users", min_value=0, max_value=st.session_state.adults, key="wheelchair_count")
 
     group_size = adults + children
-    if wheelchair:
-        wheelchair_count = 1
-    else:
-        wheelchair_count = 0
-
-    group_ids = [c["group_id"] for t in schedule for c in t["carriages"] if c["group_id"]]
-    group_id = max(group_ids, default=0) + 1
-
-    soon_train, soon_minutes = find_soon_departing_train(schedule)
-
-    # --- Check for 2-person group fallback to 4-cap carriage ---
-    if group_size <= 2 and adults >= 1 and not wheelchair:
-        already_decided = st.session_state.allow_2p_in_4cap_by_group.get(group_id, None)
-
-        if already_decided is None:
-            for train in schedule:
-                if train["cancelled"] or train["party_train"] or train["school_name"] != "":
-                    continue
-                if minutes_until_departure(train["departure_time"]) < 0:
-                    continue
-
-                available = [c for c in train["carriages"] if not c["occupied"]]
-                two_caps = [c for c in available if c["capacity"] == 2]
-                four_caps = [c for c in available if c["capacity"] == 4]
-
-                if not two_caps and four_caps:
-                    st.warning(
-                        f"🚩 Group of {group_size} can be seated in a 4-person carriage "
-                        f"on the {format_24_to_12(train['departure_time'])} train (leaves in {minutes_until_departure(train['departure_time'])} mins). Continue?"
-
-                    )
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button("✅ Yes, assign on this train"):
-                            assigned, updated = assign_group(
-                            schedule, adults, toddlers, wheelchair_count, group_size, group_id,
-                            confirmed=True)
-                            if assigned:
-                                save_schedule(updated)
-                                st.session_state.feedback = {"type": "success", "data": (updated, group_id)}
-                                st.session_state.reset_form = True
-                            else:
-                                st.session_state.feedback = {"type": "error", "data": "❌ Could not assign group to this train."}
-                            st.rerun()
-                    with col2:
-                        if st.button("❌ No, assign to 2-person carriage"):
-                            st.session_state.allow_2p_in_4cap_by_group[group_id] = False
-                            assigned, updated = assign_to_2cap_only(
-                                schedule, adults, toddlers, wheelchair_count, group_size, group_id
-                            )
-                            if assigned:
-                                save_schedule(updated)
-                                st.session_state.feedback = {"type": "success", "data": (updated, group_id)}
-                                st.session_state.reset_form = True
-                            else:
-                                st.session_state.feedback = {"type": "error", "data": "❌ Could not assign group to this train."}
-                            st.rerun()
-                    st.markdown("---")
-                    display_feedback()
-                    return
-
-    # --- Step 2: Handle special 4/5 carriage confirmation ---
-    special_train_idx = None
-    special_carriages = None
-
-    for idx, train in enumerate(schedule):
-        if train["cancelled"] or train["party_train"] or train["school_name"] != "":
-            continue
-        if minutes_until_departure(train["departure_time"]) < 0:
-            continue
-        carriages = train["carriages"]
-        if (group_size == 3 or group_size == 4) and adults >= 2:
-            if only_c4_c5_available(carriages, group_size):
-                special_train_idx = idx
-                special_carriages = ["4", "5"]
-                break
-            elif only_c1_c8_available(carriages, group_size):
-                special_train_idx = idx
-                special_carriages = ["1", "8"]
+    group = {"adults": adults, "children": children, "toddlers": toddlers, "wheelchair_count": wheelchair_count}
+
+    # Provisional id for this form's widget keys and answers; the real one is allocated when the group is booked
+    group_id = peek_next_group_id()
+    answers = st.session_state.booking_answers.setdefault(group_id, {})
+    options = AllocationOptions(
+        warning_threshold_minutes=WARNING_THRESHOLD_MINUTES,
+        no_1_4_5_8_for_group=bool(st.session_state.get("no_1_4_5_8_for_group")),
+        answers=tuple(answers.items())
+    )
+
+    def commit_booking(options, error_message, preview=None):
+        new_group_id = create_group(adults, children, toddlers, wheelchair_count)
+
+        # Another till may claim the same carriages first; if so, place the group again on fresh state
+        for _ in range(MAX_BOOKING_ATTEMPTS):
+            trains = load_upcoming_trains()
+            if preview and trains.state_key is not None and preview.overlay.trains.state_key == trains.state_key:
+                # Nothing has changed since the preview was drawn, so book exactly what it showed
+                placement = preview
+            else:
+                placement = propose(trains, group, options, seconds_of_day()).placement
+            preview = None
+            if placement is None:
                 break
+            if claim_carriages(new_group_id, placement.carriages):
+                updated = apply_placement(trains, placement, new_group_id)
+                st.session_state.feedback = {"type": "success", "data": (updated, new_group_id)}
+                st.session_state.reset_form = True
+                st.session_state.booking_answers.pop(group_id, None)
+                st.rerun()
 
-    if special_train_idx is not None:
-        train = schedule[special_train_idx]
-        key = f"group_{group_id}_{''.join(special_carriages)}"
-        if not st.session_state.confirm_c45.get(key, False):
-            st.warning(
-                f"🚩 Only space for your group is on carriages {', '.join(special_carriages)} on train at {format_24_to_12(train['departure_time'])} "
-                f"which leaves in {minutes_until_departure(train['departure_time'])} minutes"
-            )
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button(f"✅ Yes, assign to carriages {', '.join(special_carriages)}"):
-                    st.session_state.confirm_c45[key] = True
-                    st.rerun()
-            with col2:
-                if st.button("❌ No, assign to next available train"):
-                    st.session_state.confirm_c45[key] = True
-                    assigned, updated = assign_group(
-                        schedule, adults, toddlers, wheelchair_count, group_size, group_id,
-                        confirmed=False
-                    )
-                    if assigned:
-                        save_schedule(updated)
-                        st.session_state.feedback = {"type": "success", "data": (updated, group_id)}
-                        st.session_state.reset_form = True
-                    else:
-                        st.session_state.feedback = {"type": "error", "data": "❌ No space on any upcoming train."}
-                    st.rerun()
-            st.markdown("---")
-            display_feedback()
-            return
+        delete_group(new_group_id)
+        st.session_state.feedback = {"type": "error", "data": error_message}
+        st.rerun()
 
-        assigned, updated = assign_group(
-            schedule, adults, toddlers, wheelchair_count, group_size, group_id,
-            confirmed=True, restricted_carriages=special_carriages
-        )
-        if assigned:
-            save_schedule(updated)
-            st.session_state.feedback = {"type": "success", "data": (updated, group_id)}
+    def commit_rebalance(plan, schedule):
+        new_group_id = create_group(adults, children, toddlers, wheelchair_count)
+        moves = [(move.group_id, move.from_carriages, move.to_carriages) for move in plan.moves]
+        if rebalance_groups(new_group_id, plan.placement.carriages, moves):
+            updated = apply_placement(plan.placement.overlay.trains, plan.placement, new_group_id)
+            st.session_state.feedback = {
+                "type": "success", "data": (updated, new_group_id), "moves": move_lines(plan, schedule)
+            }
             st.session_state.reset_form = True
-        else:
-            st.session_state.feedback = {"type": "error", "data": "❌ Could not assign group to this train."}
-        st.rerun()
+            st.session_state.booking_answers.pop(group_id, None)
+            st.rerun()
 
-    # --- Step 3: Handle soon-departing train ---
-    def can_accommodate_wheelchair(train, wheelchair_count):
-        # Check if there are enough free spaces in carriage 2(s) for the wheelchair users
-        carriage_2_list = [c for c in train["carriages"] if c["number"] == "2" and not c.get("occupied", False)]
-        return len(carriage_2_list) >= wheelchair_count
-
-    if soon_train and group_can_fit_on_train(soon_train, group_size, adults, toddlers, wheelchair_count) and group_size != 0:
-        # Skip warning if wheelchair users exist but no room for them on carriage 2(s)
-        if wheelchair_count == 0 or (wheelchair_count > 0 and can_accommodate_wheelchair(soon_train, wheelchair_count)):
-            st.warning(f"⚠️ Train at {format_24_to_12(soon_train['departure_time'])} leaves in {soon_minutes} minutes.")
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("Assign to this train"):
-                    assigned, updated = assign_group(
-                        schedule, adults, toddlers, wheelchair_count, group_size, group_id,
-                        confirmed=True
-                    )
-                    if assigned:
-                        save_schedule(updated)
-                        st.session_state.feedback = {"type": "success", "data": (updated, group_id)}
-                        st.session_state.reset_form = True
-                    else:
-                        st.session_state.feedback = {"type": "error", "data": "❌ Could not assign group to this train."}
-                    st.rerun()
-            with col2:
-                if st.button("Assign to next available train"):
-                    assigned, updated = assign_group(
-                        schedule, adults, toddlers, wheelchair_count, group_size, group_id,
-                        confirmed=False
-                    )
-                    if assigned:
-                        save_schedule(updated)
-                        st.session_state.feedback = {"type": "success", "data": (updated, group_id)}
-                        st.session_state.reset_form = True
-                    else:
-                        st.session_state.feedback = {"type": "error", "data": "❌ No space on any upcoming train."}
-                    st.rerun()
-            st.markdown("---")
-            display_feedback()
-            return
+        # Someone booked or moved one of these seats in the meantime; staff see a fresh plan next run
+        delete_group(new_group_id)
+        st.session_state.feedback = {"type": "error", "data": "❌ Seats changed before the groups could be moved. Please try again."}
+        st.rerun()
 
+    schedule = load_upcoming_trains()
+    proposal = propose(schedule, group, options, seconds_of_day())
 
-    # --- Step 4: Default assign button with preview train time ---
+    # --- Questions for staff before the group can be placed ---
+    for confirmation in proposal.confirmations:
+        yes_label, no_label, yes_error, no_error = QUESTIONS[confirmation.question]
+        if yes_label is None:
+            yes_label = f"✅ Yes, assign to carriages {', '.join(confirmation.carriages)}"
 
-    # Try to preview assignment without committing changes
-    preview_success, preview_schedule = assign_group(
-        schedule, adults, toddlers, wheelchair_count, group_size, group_id,
-        confirmed=False  # Only a dry run
-    )
+        st.warning(question_text(confirmation, schedule[confirmation.train_index], group_size))
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button(yes_label, key=f"{confirmation.question}_{group_id}_yes"):
+                commit_booking(options.with_answer(confirmation.question, True), yes_error)
+        with col2:
+            if st.button(no_label, key=f"{confirmation.question}_{group_id}_no"):
+                if confirmation.question == MEDIUM_GROUP_PAIR:
+                    # Declining only rules the carriage out; the group is booked with the button below
+                    answers[MEDIUM_GROUP_PAIR] = False
+                    st.rerun()
+                commit_booking(options.with_answer(confirmation.question, False), no_error)
 
-    # Get the preview train time (if any)
-    train_time = None
-    if preview_success:
-        # Find which train has this group ID
-        for train in preview_schedule:
-            for carriage in train["carriages"]:
-                if carriage["group_id"] == group_id:
-                    train_time = train["departure_time"]
-                    break
-            if train_time:
-                break
+    if proposal.placement is None and proposal.confirmations:
+        st.markdown("---")
+        display_feedback()
+        return
 
-    # Format button label
+    # --- Default assign button with preview train time ---
     assign_label = f"Assign Group"
-    if train_time:
-        assign_label += f" (to {train_time})"
+    if proposal.placement:
+        assign_label += f" (to {schedule[proposal.placement.train_index]['departure_time']})"
 
-    # Show button
     if st.button(assign_label) and group_size != 0:
-        assigned, updated = assign_group(
-            schedule, adults, toddlers, wheelchair_count, group_size, group_id,
-            confirmed=False
-        )
-        if assigned:
-            save_schedule(updated)
-            st.session_state.feedback = {"type": "success", "data": (updated, group_id)}
-            st.session_state.reset_form = True
-        else:
-            st.session_state.feedback = {"type": "error", "data": "❌ No space on any upcoming train."}
-        st.rerun()
-
+        commit_booking(options, "❌ No space on any upcoming train.", proposal.placement)
+
+    # --- Large groups that would wait: move booked groups to open a run on an earlier train ---
+    if group_size != 0 and policy_for(options).band_for(group_size).handler == "large":
+        before = proposal.placement.train_index if proposal.placement else None
+        booked = {c["group_id"] for train in schedule[:before] for c in train["carriages"] if c["occupied"]}
+        plan = plan_rebalance(schedule, group, get_groups(booked - {0}), options, seconds_of_day(), before)
+        if plan:
+            departure = schedule[plan.placement.train_index]["departure_time"]
+            st.info(
+                f"🔀 Moving {len(plan.moves)} booked group(s) makes room on the {format_24_to_12(departure)} train:\n\n"
+                + "\n".join(f"- {line}" for line in move_lines(plan, schedule))
+                + f"\n\nLongest free run: {seats_recovered_text(plan, schedule)}"
+            )
+            if st.button(f"🔀 Move groups and assign (to {departure})", key=f"rebalance_{group_id}"):
+                commit_rebalance(plan, schedule)
 
     st.markdown("---")
     display_feedback()
 
-booking_page()
+if __name__ == "__main__":
+    booking_page()
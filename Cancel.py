@@ -1,7 +1,7 @@
 import streamlit as st
 import os
 from datetime import datetime
-from Code.Database import save_schedule, load_schedule
+from Code.Database import save_schedule, load_schedule, today
 from zoneinfo import ZoneInfo
 
 LOCAL = ZoneInfo("Europe/London")
@@ -17,10 +17,11 @@ def parse_time_local(time_str):
 def train_cancel_page():
     st.header("🚦 Cancel or Enable Trains")
 
-    schedule = load_schedule()
+    service_date = st.date_input("Service Date", value=today(), min_value=today(), key="cancel_service_date")
+    schedule = load_schedule(service_date)
 
     # Sort by departure time
-    schedule.sort(key=lambda x: parse_time_local(x['departure_time']))
+    schedule.sort(key=lambda x: x['departure_minute'])
 
     for train in schedule:
         # Convert 24H to 12H with AM/PM, removing leading zero
@@ -32,10 +33,10 @@ def train_cancel_page():
 
         current_status = train.get("cancelled", False)
         new_status = st.checkbox(
-            f"Cancel train at {time_12h}", value=current_status, key=train['departure_time']
+            f"Cancel train at {time_12h}", value=current_status, key=f"{service_date}_{train['departure_time']}"
         )
         train["cancelled"] = new_status
 
     if st.button("Save Changes"):
-        save_schedule(schedule)
+        save_schedule(schedule, service_date, event="TrainCancelled")
         st.success("Train schedule updated.")
@@ -0,0 +1,157 @@
+import time
+
+from Code.DayAllocator import DayAllocator
+from Code.allocation import DEFAULT_OPTIONS, place_on_train, group_size
+from Code.Policy import policy_for
+
+# Search limits
+TIME_BUDGET_SECONDS = 2.0
+TRAIN_CHOICES = 3  # Feasible trains tried per group, earliest first
+
+# Plan cost: minutes waited per person, empty seats in carriages given to a group, and people left unseated
+WAIT_WEIGHT = 1
+WASTE_WEIGHT = 10
+UNPLACED_WEIGHT = 10000
+
+def _decline(train, carriage):
+    # Nobody is there to agree to a carriage the Booking page would ask about, so the answer is no
+    return False
+
+def _asks_staff(placed, group, group_id, band):
+    # 1–2 people put in a bigger carriage, which the Booking page only does once staff agree
+    if band.handler != "small" or group["adults"] < 1 or group["wheelchair_count"] > 0:
+        return False
+    return any(
+        c["number"] not in band.two_seat_carriages for c in placed["carriages"] if c["group_id"] == group_id
+    )
+
+def _placement_cost(placed, group, group_id, from_minute):
+    carriages = [c for c in placed["carriages"] if c["group_id"] == group_id]
+    waste = sum(c["capacity"] - c["group_size"] for c in carriages)
+    wait = max(placed["departure_minute"] - from_minute, 0)
+    return WAIT_WEIGHT * wait * group_size(group) + WASTE_WEIGHT * waste, wait, waste
+
+def _fits(schedule, group, group_id, candidates, from_minute, limit, options):
+    # The first `limit` trains that will take the group, as (cost, train index, placed train, wait, waste)
+    band = policy_for(options).band_for(group_size(group))
+    found = []
+    for train_index in candidates:
+        placed = place_on_train(schedule[train_index], group, options, _decline, group_id)
+        if placed and not _asks_staff(placed, group, group_id, band):
+            cost, wait, waste = _placement_cost(placed, group, group_id, from_minute)
+            found.append((cost, train_index, placed, wait, waste))
+            if len(found) >= limit:
+                break
+    return found
+
+def _plan(placements, cost, schedule):
+    placed = [p for p in placements if p["train_index"] is not None]
+    return {
+        "placements": placements,
+        "cost": cost,
+        "wait": sum(p["wait"] * p["people"] for p in placed),
+        "waste": sum(p["waste"] for p in placed),
+        "unplaced": sum(1 for p in placements if p["train_index"] is None),
+        "schedule": schedule,
+    }
+
+def _unplaced(index, group):
+    return {"group": index, "people": group_size(group), "train_index": None, "carriages": [], "wait": 0, "waste": 0}
+
+def greedy_plan(schedule, groups, from_minute, options=DEFAULT_OPTIONS):
+    # What entering the groups one at a time on the Booking page would do: earliest train that fits, in order
+    candidates = _candidates(schedule, groups, from_minute, options)
+    schedule = list(schedule)
+    placements = [None] * len(groups)
+    cost = 0
+    for index, group in enumerate(groups):
+        group_id = -(index + 1)
+        fits = _fits(schedule, group, group_id, candidates[index], from_minute, 1, options)
+        if fits:
+            option_cost, train_index, placed, wait, waste = fits[0]
+            schedule[train_index] = placed
+            placements[index] = _placement(index, group, group_id, train_index, placed, wait, waste)
+            cost += option_cost
+        else:
+            placements[index] = _unplaced(index, group)
+            cost += UNPLACED_WEIGHT * group_size(group)
+    return _plan(placements, cost, schedule)
+
+def _placement(index, group, group_id, train_index, placed, wait, waste):
+    return {
+        "group": index,
+        "people": group_size(group),
+        "train_index": train_index,
+        "carriages": [c for c in placed["carriages"] if c["group_id"] == group_id],
+        "wait": wait,
+        "waste": waste,
+    }
+
+def _candidates(schedule, groups, from_minute, options):
+    # Trains each group could fit on before anything is placed; placing groups only ever removes trains.
+    # Trains inside the warning threshold are left out, as the Booking page asks staff before using them.
+    allocator = DayAllocator(schedule)
+    eligible = allocator.minutes_until(from_minute * 60) > options.warning_threshold_minutes
+    return [
+        allocator.candidate_trains(
+            group_size(group), group["adults"], group["wheelchair_count"], eligible=eligible,
+            policy=policy_for(options)
+        )
+        for group in groups
+    ]
+
+def plan_batch(schedule, groups, from_minute, time_budget=TIME_BUDGET_SECONDS, options=DEFAULT_OPTIONS):
+    # Places the groups together: a depth-first branch and bound over the first few trains each
+    # group fits on, hardest groups first, starting from the greedy plan so it is never worse
+    best = greedy_plan(schedule, groups, from_minute, options)
+    if not groups:
+        return best
+
+    candidates = _candidates(schedule, groups, from_minute, options)
+    order = sorted(range(len(groups)), key=lambda i: (-groups[i]["wheelchair_count"], -group_size(groups[i])))
+
+    # Optimistic cost of the groups still to place: each on its earliest train with nothing wasted
+    floor = []
+    for index in order:
+        fits = _fits(schedule, groups[index], -(index + 1), candidates[index], from_minute, 1, options)
+        floor.append(WAIT_WEIGHT * fits[0][3] * group_size(groups[index]) if fits else 0)
+    remaining_floor = [sum(floor[depth:]) for depth in range(len(order) + 1)]
+
+    deadline = time.monotonic() + time_budget
+    placements = [None] * len(groups)
+
+    def search(depth, current, cost):
+        nonlocal best
+        if time.monotonic() > deadline:
+            return
+        if cost + remaining_floor[depth] >= best["cost"]:
+            return
+        if depth == len(order):
+            best = _plan(list(placements), cost, list(current))
+            return
+
+        index = order[depth]
+        group = groups[index]
+        group_id = -(index + 1)
+        fits = _fits(current, group, group_id, candidates[index], from_minute, TRAIN_CHOICES, options)
+        if not fits:
+            placements[index] = _unplaced(index, group)
+            search(depth + 1, current, cost + UNPLACED_WEIGHT * group_size(group))
+            return
+
+        for option_cost, train_index, placed, wait, waste in sorted(fits, key=lambda f: (f[0], f[1])):
+            previous = current[train_index]
+            current[train_index] = placed
+            placements[index] = _placement(index, group, group_id, train_index, placed, wait, waste)
+            search(depth + 1, current, cost + option_cost)
+            current[train_index] = previous
+
+    search(0, list(schedule), 0)
+    return best
+
+def fill_rate(plan):
+    # Share of seats taken on the trains the plan uses
+    used = {p["train_index"] for p in plan["placements"] if p["train_index"] is not None}
+    seats = sum(c["capacity"] for i in used for c in plan["schedule"][i]["carriages"])
+    taken = sum(c["group_size"] for i in used for c in plan["schedule"][i]["carriages"] if c["occupied"])
+    return taken / seats if seats else 0.0
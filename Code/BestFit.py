@@ -1,57 +1,54 @@
-import streamlit as st
+from Code.Occupancy import occupancy_for
+from Code.Policy import policy_for, compiled_band
 
 class BestFit:
     @staticmethod
-    def bestFit(carriages, group_size):
+    def bestFit(carriages, group_size, train_id=None, no_1_4_5_8=False, options=None):
+        rules = compiled_band(policy_for(options).band_for(group_size), carriages)
+        occupancy = occupancy_for(train_id, carriages)
 
-        # Avoid carriages 4 and 5 for preference scoring
-        avoid_set = {"4", "5"}
-
-        # Disallowed carriage numbers when flag is True and group size is 3 or 4
-        disallowed_carriages = []
-        if st.session_state.get("no_1_4_5_8_for_group") and 3 <= group_size <= 4:
-            disallowed_carriages = [1, 4, 5, 8]
-
-        # Filter carriages based on disallowed list
-        filtered_carriages = [
-            carriage for carriage in carriages
-            if int(carriage["number"]) not in disallowed_carriages
-        ]
+        # Carriages staff want kept free for this band count as taken
+        if no_1_4_5_8:
+            for position in occupancy.free_positions(rules.restricted_mask):
+                occupancy.occupy(position)
 
         best_combo = None
 
-        for i in range(len(filtered_carriages)):
-            combo = []
+        # Only runs of adjacent free carriages with enough seats can hold the group. Within a run the
+        # shortest combo from each start is found with a window that only ever moves forward.
+        for run in occupancy.qualifying_runs(group_size):
+            end = run["start"]
             total_capacity = 0
             avoid_count = 0
 
-            for j in range(i, len(filtered_carriages)):
-                carriage = filtered_carriages[j]
-
-                if carriage["occupied"]:
-                    break  # Stop if carriage is occupied
-
-                total_capacity += carriage["capacity"]
-                combo.append(j)
-
-                if carriage["number"] in avoid_set:
-                    avoid_count += 1
-
-                if total_capacity >= group_size:
-                    if (
-                        best_combo is None or
-                        len(combo) < len(best_combo["indexes"]) or
-                        (len(combo) == len(best_combo["indexes"]) and (
-                            avoid_count < best_combo["avoid_count"] or
-                            (avoid_count == best_combo["avoid_count"] and total_capacity < best_combo["capacity"])
-                        ))
-                    ):
-                        best_combo = {
-                            "indexes": combo.copy(),
-                            "capacity": total_capacity,
-                            "avoid_count": avoid_count
-                        }
-                    break  # Valid combo found, move on
+            for i in range(run["start"], run["end"]):
+                while end < run["end"] and (end <= i or total_capacity < group_size):
+                    total_capacity += occupancy.capacity[end]
+                    if rules.avoid[end]:
+                        avoid_count += 1
+                    end += 1
+
+                if total_capacity < group_size:
+                    break  # Later starts only have fewer seats
+
+                combo_length = end - i
+                if (
+                    best_combo is None or
+                    combo_length < len(best_combo["indexes"]) or
+                    (combo_length == len(best_combo["indexes"]) and (
+                        avoid_count < best_combo["avoid_count"] or
+                        (avoid_count == best_combo["avoid_count"] and total_capacity < best_combo["capacity"])
+                    ))
+                ):
+                    best_combo = {
+                        "indexes": list(range(i, end)),
+                        "capacity": total_capacity,
+                        "avoid_count": avoid_count
+                    }
+
+                total_capacity -= occupancy.capacity[i]
+                if rules.avoid[i]:
+                    avoid_count -= 1
 
         return (
             {"indexes": best_combo["indexes"], "capacity": best_combo["capacity"]}
@@ -1,16 +1,166 @@
 import sqlite3
 import json 
+import queue
+import threading
+from contextlib import contextmanager
+from zoneinfo import ZoneInfo
+from Code.Occupancy import accessibility, DEFAULT_WHEELCHAIR_CAPACITY
 
 DB_FILE = "train_schedule.db"
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+# Service dates follow the railway's clock, not the server's
+LOCAL = ZoneInfo("Europe/London")
+
+# Connection tuning
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 8192
+
+# Connections are pooled for the whole process. A thread holds one from its first query until it
+# ends, then hands it back, so Streamlit's short-lived script threads reuse tuned connections
+# instead of opening a fresh one every rerun.
+POOL_SIZE = 4
+_idle = queue.LifoQueue()  # (db_file, connection) ready for the next thread
+_local = threading.local()
+
+# Process-wide read model of the schedule, invalidated by bumping the version on every write
+_schedule_lock = threading.Lock()
+_schedule_version = 0
+_schedule_cache = {}  # service_date, (service_date, from_minute) or train id -> (version, schedule)
+_archived_on = {"date": None}
+
+# Schema upgrades run once per database file per process
+_migration_lock = threading.Lock()
+_migrated_files = set()
+
+def _open_connection():
+    # Autocommit mode: transactions are opened explicitly by transaction()
+    # Pooled connections move between threads, but only one thread uses a connection at a time
+    conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False)
     conn.row_factory = sqlite3.Row  # Access columns by name
+    conn.execute("PRAGMA journal_mode = WAL")  # Readers no longer block the writer
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
     return conn
 
-def create_tables():
+class _Lease:
+    # A thread's pooled connection; returned to the pool when the thread-local goes away with its thread
+    def __init__(self, db_file, conn):
+        self.db_file = db_file
+        self.conn = conn
+
+    def __del__(self):
+        if self.conn is not None:
+            _check_in(self.db_file, self.conn)
+
+def _check_out():
+    while True:
+        try:
+            db_file, conn = _idle.get_nowait()
+        except queue.Empty:
+            return _open_connection()
+        if db_file == DB_FILE:
+            return conn
+        conn.close()
+
+def _check_in(db_file, conn):
+    try:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        if db_file == DB_FILE and _idle.qsize() < POOL_SIZE:
+            _idle.put((db_file, conn))
+            return
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+def get_db_connection():
+    lease = getattr(_local, "lease", None)
+    if lease is None or lease.db_file != DB_FILE:
+        close_db_connection()
+        lease = _local.lease = _Lease(DB_FILE, _check_out())
+    return lease.conn
+
+def close_db_connection():
+    lease = getattr(_local, "lease", None)
+    if lease is not None:
+        lease.conn.close()
+        lease.conn = None
+        _local.lease = None
+
+@contextmanager
+def transaction(immediate=False):
     conn = get_db_connection()
-    cursor = conn.cursor()
+
+    # Nested use joins the transaction that is already open
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def migrate_database():
+    # Brings the schema up to date once per process; page renders never run DDL
+    if DB_FILE in _migrated_files:
+        return
+
+    with _migration_lock:
+        if DB_FILE in _migrated_files:
+            return
+
+        needs_snapshot = False
+        while True:
+            # Each step commits together with its version bump, so an interrupted upgrade resumes cleanly
+            # and a second process waiting on the write lock sees the steps already applied
+            with transaction(immediate=True) as conn:
+                cursor = conn.cursor()
+                version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                if version >= len(MIGRATIONS):
+                    break
+                needs_snapshot = MIGRATIONS[version](cursor) or needs_snapshot
+                cursor.execute(f"PRAGMA user_version = {version + 1}")
+
+        if needs_snapshot:
+            # Older snapshots don't match the new columns, so replay has to start from here
+            with transaction(immediate=True) as conn:
+                cursor = conn.cursor()
+                last_event = cursor.execute("SELECT MAX(id) FROM booking_events").fetchone()[0]
+                if last_event is not None:
+                    _take_snapshot(cursor, last_event)
+
+        _migrated_files.add(DB_FILE)
+
+def get_schema_version():
+    return get_db_connection().execute("PRAGMA user_version").fetchone()[0]
+
+CARRIAGES_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        train_id INTEGER NOT NULL,
+        number TEXT NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0,
+        capacity INTEGER NOT NULL,
+        occupied BOOLEAN NOT NULL DEFAULT 0,
+        group_size INTEGER NOT NULL DEFAULT 0,
+        toddlers INTEGER NOT NULL DEFAULT 0,
+        wheelchair BOOLEAN NOT NULL DEFAULT 0,
+        group_id INTEGER REFERENCES groups(id) ON DELETE SET NULL,
+        FOREIGN KEY(train_id) REFERENCES trains(id) ON DELETE CASCADE
+    )"""
+
+# Migration steps, applied in order. Databases from before versioning are at user_version 0
+# and may already have some of these changes, so every step checks before altering anything.
+# Append new steps to the end; never edit or reorder one that has shipped.
+
+def _migrate_base_tables(cursor):
+    # The tables as the app first created them
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS trains (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -32,133 +182,952 @@ def create_tables():
         group_id INTEGER NOT NULL DEFAULT 0,
         FOREIGN KEY(train_id) REFERENCES trains(id) ON DELETE CASCADE
     )""")
-    conn.commit()
-    conn.close()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS daily_notes (
+        date TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT,
+        PRIMARY KEY (date, key)
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS presets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        schedule TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS custom_questions (
+        id TEXT PRIMARY KEY,
+        text TEXT NOT NULL
+    )""")
 
-def save_schedule(schedule):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _migrate_typed_columns(cursor):
+    if "departure_minute" not in _table_columns(cursor, "trains"):
+        cursor.execute("ALTER TABLE trains ADD COLUMN departure_minute INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("""
+        UPDATE trains SET departure_minute =
+            CAST(substr(departure_time, 1, 2) AS INTEGER) * 60 + CAST(substr(departure_time, 4, 2) AS INTEGER)
+        """)
+    if "position" not in _table_columns(cursor, "carriages"):
+        cursor.execute("ALTER TABLE carriages ADD COLUMN position INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("UPDATE carriages SET position = CAST(number AS INTEGER)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_carriages_train_position ON carriages(train_id, position)")
+
+def _migrate_groups(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        adults INTEGER NOT NULL DEFAULT 0,
+        children INTEGER NOT NULL DEFAULT 0,
+        toddlers INTEGER NOT NULL DEFAULT 0,
+        wheelchair_count INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        source TEXT NOT NULL DEFAULT 'auto'
+    )""")
+    if not any(fk["table"] == "groups" for fk in cursor.execute("PRAGMA foreign_key_list(carriages)").fetchall()):
+        _link_carriages_to_groups(cursor)
+    # Rebuilding the table drops its indexes
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_carriages_train_position ON carriages(train_id, position)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_carriages_group ON carriages(group_id)")
+
+def _migrate_journal(cursor):
+    _create_journal_tables(cursor)
 
-    # Clear previous schedule data before saving new one
-    cursor.execute("DELETE FROM carriages")
-    cursor.execute("DELETE FROM trains")
-    conn.commit()
+def _migrate_service_date(cursor):
+    added = "service_date" not in _table_columns(cursor, "trains")
+    if added:
+        # Until now the tables only ever held the current day
+        cursor.execute("ALTER TABLE trains ADD COLUMN service_date TEXT NOT NULL DEFAULT ''")
+        cursor.execute("UPDATE trains SET service_date = ?", (today().isoformat(),))
+
+    # Per-day queries filter on the date and then order or range-scan on the minute
+    cursor.execute("DROP INDEX IF EXISTS idx_trains_departure_minute")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_trains_date_minute ON trains(service_date, departure_minute)")
+
+    # Snapshots taken before this don't know the dates
+    return added
+
+def _migrate_archive_tables(cursor):
+    # Cold storage for past days, never read by the booking pages
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS trains_archive (
+        id INTEGER PRIMARY KEY,
+        departure_time TEXT NOT NULL,
+        cancelled BOOLEAN NOT NULL DEFAULT 0,
+        party_train BOOLEAN NOT NULL DEFAULT 0,
+        school_name TEXT DEFAULT '',
+        departure_minute INTEGER NOT NULL DEFAULT 0,
+        service_date TEXT NOT NULL
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS carriages_archive (
+        id INTEGER PRIMARY KEY,
+        train_id INTEGER NOT NULL,
+        number TEXT NOT NULL,
+        position INTEGER NOT NULL DEFAULT 0,
+        capacity INTEGER NOT NULL,
+        occupied BOOLEAN NOT NULL DEFAULT 0,
+        group_size INTEGER NOT NULL DEFAULT 0,
+        toddlers INTEGER NOT NULL DEFAULT 0,
+        wheelchair BOOLEAN NOT NULL DEFAULT 0,
+        group_id INTEGER
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_trains_archive_date ON trains_archive(service_date)")
+
+def _migrate_accessibility(cursor):
+    # Which carriages take a wheelchair and how many of the group fit in one with it aboard;
+    # until now that was always carriage 2 with 3 seats
+    added = False
+    for table in ("carriages", "carriages_archive"):
+        if "accessible" not in _table_columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN accessible BOOLEAN NOT NULL DEFAULT 0")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN wheelchair_capacity INTEGER NOT NULL DEFAULT 0")
+            for number, seats in DEFAULT_WHEELCHAIR_CAPACITY.items():
+                cursor.execute(
+                    f"UPDATE {table} SET accessible = 1, wheelchair_capacity = ? WHERE number = ?", (seats, number)
+                )
+            added = True
+
+    # Snapshots taken before this don't know which carriages are accessible
+    return added
+
+def _migrate_allocation_policy(cursor):
+    # Staff overrides of the shipped allocation policy; one row at most
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS allocation_policy (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        policy TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )""")
+
+def _migrate_undo_index(cursor):
+    # Each event records the Undo that reverted it, so undo finds its target without reading the journal
+    if "undone_by" not in _table_columns(cursor, "booking_events"):
+        cursor.execute("ALTER TABLE booking_events ADD COLUMN undone_by INTEGER")
+        undos = cursor.execute("SELECT id, payload FROM booking_events WHERE event_type = 'Undo'").fetchall()
+        for row in undos:
+            undoes = json.loads(row["payload"])["details"]["undoes"]
+            cursor.execute("UPDATE booking_events SET undone_by = ? WHERE id = ?", (row["id"], undoes))
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_booking_events_undoable ON booking_events(id)
+    WHERE undone_by IS NULL AND event_type != 'Undo'
+    """)
+
+def _migrate_snapshot_dates(cursor):
+    # Snapshots are taken per service date, so a booking only re-serialises the days it touched
+    if "service_date" not in _table_columns(cursor, "schedule_snapshots"):
+        cursor.execute("ALTER TABLE schedule_snapshots ADD COLUMN service_date TEXT")
+    cursor.execute("DROP INDEX IF EXISTS idx_schedule_snapshots_event")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_schedule_snapshots_date_event ON schedule_snapshots(service_date, event_id)"
+    )
+    # Whole-schedule snapshots are replaced by one per date, taken once the upgrade finishes
+    cursor.execute("DELETE FROM schedule_snapshots")
+    return True
+
+MIGRATIONS = [
+    _migrate_base_tables,
+    _migrate_typed_columns,
+    _migrate_groups,
+    _migrate_journal,
+    _migrate_service_date,
+    _migrate_archive_tables,
+    _migrate_accessibility,
+    _migrate_allocation_policy,
+    _migrate_undo_index,
+    _migrate_snapshot_dates,
+]
+
+def _link_carriages_to_groups(cursor):
+    # Groups booked before the groups table existed only know their carriages,
+    # so everyone in them is counted as an adult
+    cursor.execute("""
+    INSERT OR IGNORE INTO groups (id, adults, toddlers, wheelchair_count, created_at, source)
+    SELECT group_id, SUM(group_size), SUM(toddlers), SUM(wheelchair), ?, 'legacy'
+    FROM carriages WHERE group_id > 0 GROUP BY group_id
+    """, (datetime.utcnow().isoformat(),))
+
+    # SQLite can't add a foreign key to an existing column, so rebuild the table
+    cursor.execute(CARRIAGES_TABLE.format(name="carriages_new"))
+    cursor.execute("""
+    INSERT INTO carriages_new (id, train_id, number, position, capacity, occupied, group_size, toddlers, wheelchair, group_id)
+    SELECT id, train_id, number, position, capacity, occupied, group_size, toddlers, wheelchair, NULLIF(group_id, 0)
+    FROM carriages
+    """)
+    cursor.execute("DROP TABLE carriages")
+    cursor.execute("ALTER TABLE carriages_new RENAME TO carriages")
+
+def _table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row["name"] for row in cursor.fetchall()}
+
+def time_to_minute(time_str):
+    # "HH:MM" -> minutes after midnight
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+TRAIN_COLUMNS = ("departure_time", "cancelled", "party_train", "school_name", "departure_minute", "service_date")
+CARRIAGE_COLUMNS = (
+    "train_id", "number", "position", "capacity", "occupied", "group_size", "toddlers", "wheelchair", "group_id",
+    "accessible", "wheelchair_capacity"
+)
+GROUP_COLUMNS = ("adults", "children", "toddlers", "wheelchair_count", "created_at", "source")
+TABLE_COLUMNS = {"trains": TRAIN_COLUMNS, "carriages": CARRIAGE_COLUMNS, "groups": GROUP_COLUMNS}
+
+def _train_row(train, service_date):
+    return (
+        train['departure_time'],
+        int(train['cancelled']),
+        int(train['party_train']),
+        train['school_name'] or "",
+        time_to_minute(train['departure_time']),
+        service_date
+    )
+
+def _carriage_row(train_id, carriage):
+    accessible, wheelchair_capacity = accessibility(carriage)
+    return (
+        train_id,
+        carriage['number'],
+        int(carriage['number']),
+        carriage['capacity'],
+        int(carriage['occupied']),
+        carriage['group_size'],
+        carriage['toddlers'],
+        int(carriage['wheelchair']),
+        carriage['group_id'] or None,  # Empty carriages don't reference a group
+        int(accessible),
+        wheelchair_capacity
+    )
+
+def _select_rows(cursor, table, where="", params=()):
+    columns = TABLE_COLUMNS[table]
+    cursor.execute(f"SELECT id, {', '.join(columns)} FROM {table} {where}", params)
+    return {row["id"]: tuple(row)[1:] for row in cursor.fetchall()}
+
+def _insert_row(cursor, table, values):
+    columns = TABLE_COLUMNS[table]
+    cursor.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        values
+    )
+    return cursor.lastrowid
+
+def _update_row(cursor, table, row_id, values):
+    columns = TABLE_COLUMNS[table]
+    cursor.execute(
+        f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+        tuple(values) + (row_id,)
+    )
+
+def _change(table, row_id, before, after):
+    # One journal entry: the row as it was and as it now is (None when absent)
+    columns = TABLE_COLUMNS[table]
+    return [
+        table,
+        row_id,
+        dict(zip(columns, before)) if before is not None else None,
+        dict(zip(columns, after)) if after is not None else None
+    ]
+
+def save_schedule(schedule, service_date=None, event="ScheduleSaved", details=None):
+    # The schedule replaces that one day's trains; other days are left alone
+    service_date = _date_key(service_date)
+
+    # Take the write lock up front so the rows we diff against can't change underneath us
+    with transaction(immediate=True) as conn:
+        cursor = conn.cursor()
+        changes = _write_schedule(cursor, schedule, service_date)
+        if changes:
+            _record_event(cursor, event, changes, dict(details or {}, service_date=service_date))
+
+    bump_schedule_version()
+
+def _write_schedule(cursor, schedule, service_date):
+    # Compare against what is stored so only changed rows are written
+    stored_trains = _select_rows(cursor, "trains", "WHERE service_date = ?", (service_date,))
+    stored_carriages = _select_rows(
+        cursor, "carriages", "WHERE train_id IN (SELECT id FROM trains WHERE service_date = ?)", (service_date,)
+    )
+
+    kept_trains = set()
+    kept_carriages = set()
+    changes = []
 
     for train in schedule:
-        cursor.execute(
-            "INSERT INTO trains (departure_time, cancelled, party_train, school_name) VALUES (?, ?, ?, ?)",
-            (train['departure_time'], int(train['cancelled']), int(train['party_train']), train['school_name'])
-        )
-        train_id = cursor.lastrowid
+        train_row = _train_row(train, service_date)
+        train_id = train.get('id')
+
+        if train_id in stored_trains and train_id not in kept_trains:
+            if stored_trains[train_id] != train_row:
+                _update_row(cursor, "trains", train_id, train_row)
+                changes.append(_change("trains", train_id, stored_trains[train_id], train_row))
+        else:
+            train_id = _insert_row(cursor, "trains", train_row)
+            train['id'] = train_id
+            train['service_date'] = service_date
+            changes.append(_change("trains", train_id, None, train_row))
+        kept_trains.add(train_id)
 
         for carriage in train['carriages']:
-            cursor.execute(
-                "INSERT INTO carriages (train_id, number, capacity, occupied, group_size, toddlers, wheelchair, group_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (
-                    train_id,
-                    carriage['number'],
-                    carriage['capacity'],
-                    int(carriage['occupied']),
-                    carriage['group_size'],
-                    carriage['toddlers'],
-                    int(carriage['wheelchair']),
-                    carriage['group_id']
-                )
-            )
+            carriage_row = _carriage_row(train_id, carriage)
+            carriage_id = carriage.get('id')
+            stored = stored_carriages.get(carriage_id)
+
+            if stored and stored[0] == train_id and carriage_id not in kept_carriages:
+                if stored != carriage_row:
+                    _update_row(cursor, "carriages", carriage_id, carriage_row)
+                    changes.append(_change("carriages", carriage_id, stored, carriage_row))
+            else:
+                carriage_id = _insert_row(cursor, "carriages", carriage_row)
+                carriage['id'] = carriage_id
+                changes.append(_change("carriages", carriage_id, None, carriage_row))
+            kept_carriages.add(carriage_id)
 
-    conn.commit()
-    conn.close()
+    # Anything stored but no longer in the schedule has been removed
+    removed_carriages = [cid for cid in stored_carriages if cid not in kept_carriages]
+    removed_trains = [tid for tid in stored_trains if tid not in kept_trains]
+    cursor.executemany("DELETE FROM carriages WHERE id = ?", [(cid,) for cid in removed_carriages])
+    cursor.executemany("DELETE FROM trains WHERE id = ?", [(tid,) for tid in removed_trains])
+    changes.extend(_change("carriages", cid, stored_carriages[cid], None) for cid in removed_carriages)
+    changes.extend(_change("trains", tid, stored_trains[tid], None) for tid in removed_trains)
 
-def load_schedule():
+    return changes
+
+def get_schedule_version():
+    return _schedule_version
+
+def bump_schedule_version():
+    global _schedule_version
+    with _schedule_lock:
+        _schedule_version += 1
+
+def _copy_schedule(schedule):
+    # Pages edit the dicts they are given, so never hand out the cached ones
+    return [
+        {**train, "carriages": [dict(c) for c in train["carriages"]]}
+        for train in schedule
+    ]
+
+def today():
+    return datetime.now(LOCAL).date()
+
+def _date_key(service_date):
+    # None means today; dates are stored as ISO strings
+    if service_date is None:
+        service_date = today()
+    return service_date if isinstance(service_date, str) else service_date.isoformat()
+
+def _read_schedule(service_date, bookable_from=None, train_id=None):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT * FROM trains ORDER BY departure_time")
-    trains = cursor.fetchall()
+    where = "t.service_date = ?"
+    params = (service_date,)
+    if train_id is not None:
+        where += " AND t.id = ?"
+        params += (train_id,)
+    if bookable_from is not None:
+        # Same rule as is_bookable(), so the planner can range-scan the (service_date, departure_minute) index
+        where += " AND t.departure_minute >= ? AND t.cancelled = 0 AND t.party_train = 0 AND COALESCE(t.school_name, '') = ''"
+        params += (bookable_from,)
+
+    cursor.execute(f"""
+    SELECT t.id AS train_id, t.departure_time, t.departure_minute, t.cancelled, t.party_train, t.school_name,
+           t.service_date, c.id AS carriage_id, c.number, c.position, c.capacity, c.occupied, c.group_size,
+           c.toddlers, c.wheelchair, c.group_id, c.accessible, c.wheelchair_capacity
+    FROM trains t
+    LEFT JOIN carriages c ON c.train_id = t.id
+    WHERE {where}
+    ORDER BY t.departure_minute, t.id, c.position
+    """, params)
+    rows = cursor.fetchall()
 
     schedule = []
-    for train in trains:
+    train = None
+    for row in rows:
+        if train is None or train["id"] != row["train_id"]:
+            train = {
+                "id": row["train_id"],
+                "departure_time": row["departure_time"],
+                "departure_minute": row["departure_minute"],
+                "cancelled": bool(row["cancelled"]),
+                "party_train": bool(row["party_train"]),
+                "school_name": row["school_name"],
+                "service_date": row["service_date"],
+                "carriages": []
+            }
+            schedule.append(train)
+
+        if row["carriage_id"] is not None:
+            train["carriages"].append({
+                "id": row["carriage_id"],
+                "number": row["number"],
+                "position": row["position"],
+                "capacity": row["capacity"],
+                "occupied": bool(row["occupied"]),
+                "group_size": row["group_size"],
+                "toddlers": row["toddlers"],
+                "wheelchair": bool(row["wheelchair"]),
+                "group_id": row["group_id"] or 0,
+                "accessible": bool(row["accessible"]),
+                "wheelchair_capacity": row["wheelchair_capacity"],
+            })
+
+    return schedule
+
+def _store_cached(key, version, schedule):
+    with _schedule_lock:
+        # Only keep the result if no write landed while we were reading
+        if _schedule_version != version:
+            return False
+        stale = [
+            k for k, (v, _) in _schedule_cache.items()
+            if v != version or (isinstance(k, tuple) and isinstance(key, tuple) and k[0] == key[0])
+        ]
+        for k in stale:
+            del _schedule_cache[k]
+        _schedule_cache[key] = (version, schedule)
+        return True
+
+def load_schedule(service_date=None):
+    service_date = _date_key(service_date)
+    if _archived_on["date"] != today():
+        archive_past_days()
+
+    with _schedule_lock:
+        version = _schedule_version
+        cached = _schedule_cache.get(service_date)
+        if cached and cached[0] == version:
+            return _copy_schedule(cached[1])
+
+    schedule = _read_schedule(service_date)
+
+    _store_cached(service_date, version, schedule)
+
+    return _copy_schedule(schedule)
+
+def load_train(service_date, train_id):
+    # One train of the day, or None. Served from the day's cached schedule when it is current,
+    # otherwise read on its own so a fragment rerun after a write doesn't reload the whole day.
+    service_date = _date_key(service_date)
+    with _schedule_lock:
+        version = _schedule_version
+        cached = _schedule_cache.get(service_date)
+        if cached and cached[0] == version:
+            trains = [t for t in cached[1] if t["id"] == train_id]
+            return _copy_schedule(trains)[0] if trains else None
+        cached = _schedule_cache.get(train_id)
+        if cached and cached[0] == version:
+            return _copy_schedule(cached[1])[0] if cached[1] else None
+
+    trains = _read_schedule(service_date, train_id=train_id)
+
+    _store_cached(train_id, version, trains)
+
+    return _copy_schedule(trains)[0] if trains else None
+
+def is_bookable(train, from_minute):
+    return (
+        train["departure_minute"] >= from_minute
+        and not train["cancelled"]
+        and not train["party_train"]
+        and not train["school_name"]
+    )
+
+def bookable_view(schedule, from_minute):
+    # In-memory twin of the bookable-trains query, for schedules that are already loaded
+    return [train for train in schedule if is_bookable(train, from_minute)]
+
+def load_bookable_trains(from_minute, service_date=None):
+    # Only trains that can still take a booking: not departed, cancelled, party or school,
+    # ordered by departure. Served from the day's cached schedule when that is current.
+    return load_bookable_snapshot(from_minute, service_date)[1]
+
+def load_bookable_snapshot(from_minute, service_date=None):
+    # The bookable trains plus the schedule version they are known to match,
+    # or None when a write landed while they were being read
+    service_date = _date_key(service_date)
+    with _schedule_lock:
+        version = _schedule_version
+        cached = _schedule_cache.get(service_date)
+        if cached and cached[0] == version:
+            return version, _copy_schedule(bookable_view(cached[1], from_minute))
+        cached = _schedule_cache.get((service_date, from_minute))
+        if cached and cached[0] == version:
+            return version, _copy_schedule(cached[1])
+
+    trains = _read_schedule(service_date, bookable_from=from_minute)
+
+    if not _store_cached((service_date, from_minute), version, trains):
+        version = None
+
+    return version, _copy_schedule(trains)
+
+def list_service_dates():
+    conn = get_db_connection()
+    cursor = conn.execute("SELECT DISTINCT service_date FROM trains ORDER BY service_date")
+    return [row["service_date"] for row in cursor.fetchall()]
+
+def archive_past_days(before=None):
+    # Moves finished days into the archive tables so the hot tables only hold today and later
+    before = _date_key(before)
+    with transaction(immediate=True) as conn:
+        cursor = conn.cursor()
+        trains = _select_rows(cursor, "trains", "WHERE service_date < ?", (before,))
+        if trains:
+            carriages = _select_rows(
+                cursor, "carriages", "WHERE train_id IN (SELECT id FROM trains WHERE service_date < ?)", (before,)
+            )
+            cursor.execute(
+                f"INSERT OR REPLACE INTO trains_archive (id, {', '.join(TRAIN_COLUMNS)}) "
+                f"SELECT id, {', '.join(TRAIN_COLUMNS)} FROM trains WHERE service_date < ?", (before,)
+            )
+            cursor.execute(
+                f"INSERT OR REPLACE INTO carriages_archive (id, {', '.join(CARRIAGE_COLUMNS)}) "
+                f"SELECT id, {', '.join(CARRIAGE_COLUMNS)} FROM carriages "
+                f"WHERE train_id IN (SELECT id FROM trains WHERE service_date < ?)", (before,)
+            )
+            cursor.execute("DELETE FROM trains WHERE service_date < ?", (before,))  # Carriages cascade
+
+            changes = [_change("carriages", cid, row, None) for cid, row in carriages.items()]
+            changes += [_change("trains", tid, row, None) for tid, row in trains.items()]
+            _record_event(cursor, "DaysArchived", changes, {"before": before})
+
+    if before == today().isoformat():
+        _archived_on["date"] = today()
+    if trains:
+        bump_schedule_version()
+
+def create_group(adults, children, toddlers, wheelchair_count, source="auto"):
+    conn = get_db_connection()
+    cursor = conn.execute(
+        "INSERT INTO groups (adults, children, toddlers, wheelchair_count, created_at, source) VALUES (?, ?, ?, ?, ?, ?)",
+        (adults, children, toddlers, wheelchair_count, datetime.utcnow().isoformat(), source)
+    )
+    return cursor.lastrowid
+
+def peek_next_group_id():
+    # The id the next create_group call will most likely get; for labels and keys only
+    conn = get_db_connection()
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'groups'").fetchone()
+    return (row["seq"] if row else 0) + 1
+
+def get_group(group_id):
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM groups WHERE id = ?", (group_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_groups(group_ids):
+    group_ids = list(group_ids)
+    if not group_ids:
+        return {}
+    conn = get_db_connection()
+    placeholders = ", ".join("?" for _ in group_ids)
+    rows = conn.execute(f"SELECT * FROM groups WHERE id IN ({placeholders})", tuple(group_ids)).fetchall()
+    return {row["id"]: dict(row) for row in rows}
+
+def get_group_carriages(group_id):
+    conn = get_db_connection()
+    cursor = conn.execute("""
+    SELECT c.*, t.departure_time
+    FROM carriages c
+    JOIN trains t ON t.id = c.train_id
+    WHERE c.group_id = ?
+    ORDER BY c.position
+    """, (group_id,))
+    return [dict(row) for row in cursor.fetchall()]
+
+def delete_group(group_id):
+    # For groups that were created but never placed
+    conn = get_db_connection()
+    conn.execute("DELETE FROM groups WHERE id = ?", (group_id,))
+
+class _ClaimLost(Exception):
+    pass
+
+def _select_carriages(cursor, carriage_ids):
+    placeholders = ", ".join("?" for _ in carriage_ids)
+    return _select_rows(cursor, "carriages", f"WHERE id IN ({placeholders})", tuple(carriage_ids)) if carriage_ids else {}
+
+def _claim(cursor, group_id, carriages):
+    for carriage in carriages:
+        cursor.execute("""
+        UPDATE carriages SET occupied = 1, group_size = ?, toddlers = ?, wheelchair = ?, group_id = ?
+        WHERE id = ? AND occupied = 0
+        """, (carriage['group_size'], carriage['toddlers'], int(carriage['wheelchair']), group_id, carriage['id']))
+        if cursor.rowcount != 1:
+            raise _ClaimLost()
+
+def _release(cursor, group_id, carriages):
+    for carriage in carriages:
+        cursor.execute("""
+        UPDATE carriages SET occupied = 0, group_size = 0, toddlers = 0, wheelchair = 0, group_id = NULL
+        WHERE id = ? AND occupied = 1 AND group_id = ?
+        """, (carriage['id'], group_id))
+        if cursor.rowcount != 1:
+            raise _ClaimLost()
+
+def _claim_event(event_type, carriages, details, moves=()):
+    # Claims (and first releases) carriages in one transaction, journaled as a single event so undo
+    # reverses all of it. False if any of the seats changed since they were read.
+    carriage_ids = list(dict.fromkeys(
+        [c['id'] for _, released, claimed in moves for c in list(released) + list(claimed)] + [c['id'] for c in carriages]
+    ))
+    try:
+        with transaction(immediate=True) as conn:
+            cursor = conn.cursor()
+            before = _select_carriages(cursor, carriage_ids)
+            for moved_group_id, released, _ in moves:
+                _release(cursor, moved_group_id, released)
+            for moved_group_id, _, claimed in moves:
+                _claim(cursor, moved_group_id, claimed)
+            _claim(cursor, details["group_id"], carriages)
+            after = _select_carriages(cursor, carriage_ids)
+            changes = [_change("carriages", cid, before[cid], after[cid]) for cid in carriage_ids]
+            _record_event(cursor, event_type, changes, details)
+    except _ClaimLost:
+        # Whatever we allocated against was stale, so drop the cached read model too
+        bump_schedule_version()
+        return False
+
+    bump_schedule_version()
+    return True
+
+def claim_carriages(group_id, carriages):
+    # Seats are only taken if every carriage is still free; otherwise nothing is written
+    return _claim_event("GroupAssigned", carriages, {"group_id": group_id})
+
+def rebalance_groups(group_id, carriages, moves):
+    # Moves booked groups, given as (group id, carriages it leaves, carriages it takes), then seats
+    # the new group in the space they opened. Nothing is written unless every move still applies.
+    details = {"group_id": group_id, "moved": [moved_group_id for moved_group_id, _, _ in moves]}
+    return _claim_event("GroupsRebalanced", carriages, details, moves)
+
+def claim_batch(bookings, source="batch"):
+    # Creates and seats every group of a batch, given as (group, carriages), in one transaction
+    # journaled as a single event. The new group ids in order, or None with nothing written if any
+    # of the seats changed since they were read.
+    carriage_ids = [c['id'] for _, carriages in bookings for c in carriages]
+    try:
+        with transaction(immediate=True) as conn:
+            cursor = conn.cursor()
+            before = _select_carriages(cursor, carriage_ids)
+            group_ids = []
+            for group, carriages in bookings:
+                group_id = create_group(
+                    group["adults"], group["children"], group["toddlers"], group["wheelchair_count"], source=source
+                )
+                _claim(cursor, group_id, carriages)
+                group_ids.append(group_id)
+            after = _select_carriages(cursor, carriage_ids)
+            changes = [_change("carriages", cid, before[cid], after[cid]) for cid in carriage_ids]
+            _record_event(cursor, "BatchAssigned", changes, {"group_ids": group_ids})
+    except _ClaimLost:
+        bump_schedule_version()
+        return None
+
+    bump_schedule_version()
+    return group_ids
+
+def remove_group(group_id):
+    with transaction(immediate=True) as conn:
+        cursor = conn.cursor()
+        before = _select_rows(cursor, "carriages", "WHERE group_id = ?", (group_id,))
+        group = _select_rows(cursor, "groups", "WHERE id = ?", (group_id,)).get(group_id)
+
         cursor.execute(
-            "SELECT * FROM carriages WHERE train_id = ? ORDER BY CAST(number AS INTEGER)",
-            (train["id"],)
+            "UPDATE carriages SET occupied = 0, group_size = 0, toddlers = 0, wheelchair = 0, group_id = NULL WHERE group_id = ?",
+            (group_id,)
         )
-        carriages = cursor.fetchall()
+        cursor.execute("DELETE FROM groups WHERE id = ?", (group_id,))
+
+        after = _select_carriages(cursor, list(before))
+        changes = [_change("carriages", cid, row, after[cid]) for cid, row in before.items()]
+        if group is not None:
+            changes.append(_change("groups", group_id, group, None))
+        _record_event(cursor, "GroupRemoved", changes, {"group_id": group_id})
+
+    bump_schedule_version()
+
+# --- Booking journal ---
+# Every write appends an event holding the before/after image of each row it touched.
+# Every SNAPSHOT_EVERY_EVENTS events the trains and carriages of each service date touched since
+# the last round are snapshotted, so the schedule can be rebuilt from the latest snapshot of each
+# date plus a short replay, and any event can be undone.
+
+SNAPSHOT_EVERY_EVENTS = 50
+SNAPSHOTS_KEPT = 3  # Per service date
+
+def _create_journal_tables(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS booking_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_type TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schedule_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedule_snapshots_event ON schedule_snapshots(event_id)")
+
+def _record_event(cursor, event_type, changes, details=None):
+    if not changes:
+        return None
+
+    cursor.execute(
+        "INSERT INTO booking_events (event_type, payload, created_at) VALUES (?, ?, ?)",
+        (event_type, json.dumps({"changes": changes, "details": details or {}}), datetime.utcnow().isoformat())
+    )
+    event_id = cursor.lastrowid
 
-        schedule.append({
-            "id": train["id"],
+    cursor.execute("SELECT MAX(event_id) FROM schedule_snapshots")
+    last_snapshot = cursor.fetchone()[0]
+    # The first snapshot includes this event, so replay never needs anything older than the journal
+    if last_snapshot is None:
+        _take_snapshot(cursor, event_id)
+    elif event_id - last_snapshot >= SNAPSHOT_EVERY_EVENTS:
+        _take_snapshot(cursor, event_id, _touched_dates(cursor, last_snapshot))
+
+    return event_id
+
+def _touched_dates(cursor, after_event):
+    # Service dates changed by events after `after_event`, or None when a carriage's date can't be told
+    train_dates = {}
+    carriage_trains = set()
+    cursor.execute("SELECT payload FROM booking_events WHERE id > ?", (after_event,))
+    for row in cursor.fetchall():
+        for table, row_id, before, after in json.loads(row["payload"])["changes"]:
+            for image in (before, after):
+                if image is None:
+                    continue
+                if table == "trains":
+                    train_dates[row_id] = image.get("service_date")
+                elif table == "carriages":
+                    carriage_trains.add(image["train_id"])
+
+    unknown = [tid for tid in carriage_trains if tid not in train_dates]
+    if unknown:
+        placeholders = ", ".join("?" for _ in unknown)
+        cursor.execute(f"SELECT id, service_date FROM trains WHERE id IN ({placeholders})", unknown)
+        train_dates.update({row["id"]: row["service_date"] for row in cursor.fetchall()})
+    if any(train_dates.get(tid) is None for tid in carriage_trains):
+        return None
+    return set(train_dates.values())
+
+def _take_snapshot(cursor, event_id, service_dates=None):
+    # One snapshot per service date; every date when `service_dates` is None
+    if service_dates is None:
+        cursor.execute("SELECT DISTINCT service_date FROM trains")
+        service_dates = {row["service_date"] for row in cursor.fetchall()}
+
+    now = datetime.utcnow().isoformat()
+    for service_date in sorted(service_dates):
+        trains = _select_rows(cursor, "trains", "WHERE service_date = ?", (service_date,))
+        carriages = _select_rows(
+            cursor, "carriages", "WHERE train_id IN (SELECT id FROM trains WHERE service_date = ?)", (service_date,)
+        )
+        state = {
+            table: [dict(zip(("id",) + TABLE_COLUMNS[table], (row_id,) + row)) for row_id, row in rows.items()]
+            for table, rows in (("trains", trains), ("carriages", carriages))
+        }
+        cursor.execute(
+            "INSERT INTO schedule_snapshots (event_id, service_date, state, created_at) VALUES (?, ?, ?, ?)",
+            (event_id, service_date, json.dumps(state), now)
+        )
+        cursor.execute("""
+        DELETE FROM schedule_snapshots WHERE service_date = ? AND id NOT IN (
+            SELECT id FROM schedule_snapshots WHERE service_date = ? ORDER BY event_id DESC LIMIT ?
+        )""", (service_date, service_date, SNAPSHOTS_KEPT))
+
+def _apply_changes(cursor, changes, undo=False):
+    for table, row_id, before, after in (reversed(changes) if undo else changes):
+        values = before if undo else after
+        if values is None:
+            cursor.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+            continue
+
+        # Events written before a column existed simply leave it at its default
+        columns = [c for c in TABLE_COLUMNS[table] if c in values]
+        cursor.execute(
+            f"INSERT INTO {table} (id, {', '.join(columns)}) VALUES (?, {', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columns)}",
+            (row_id,) + tuple(values[c] for c in columns)
+        )
+
+def _replay(state, changes):
+    for table, row_id, _, after in changes:
+        if table not in state:
+            continue
+        if after is None:
+            state[table].pop(row_id, None)
+            if table == "trains":
+                state["carriages"] = {
+                    cid: row for cid, row in state["carriages"].items() if row["train_id"] != row_id
+                }
+        else:
+            state[table][row_id] = {**state[table].get(row_id, {}), **after}
+
+def rebuild_state():
+    # The latest snapshot of each date plus every event since the last snapshot round; returns
+    # {"trains": {id: row}, "carriages": {id: row}}. A round snapshots every date touched since the
+    # round before, so each date's latest snapshot still holds at the last round.
+    conn = get_db_connection()
+    snapshots = conn.execute("""
+    SELECT s.event_id, s.state FROM schedule_snapshots s
+    WHERE s.event_id = (SELECT MAX(event_id) FROM schedule_snapshots WHERE service_date = s.service_date)
+    """).fetchall()
+    if not snapshots:
+        return None
+
+    state = {"trains": {}, "carriages": {}}
+    for snapshot in snapshots:
+        for table, rows in json.loads(snapshot["state"]).items():
+            state[table].update({row["id"]: {k: v for k, v in row.items() if k != "id"} for row in rows})
+
+    last_round = max(snapshot["event_id"] for snapshot in snapshots)
+    cursor = conn.execute("SELECT payload FROM booking_events WHERE id > ? ORDER BY id", (last_round,))
+    for row in cursor.fetchall():
+        _replay(state, json.loads(row["payload"])["changes"])
+    return state
+
+def rebuild_schedule(service_date=None):
+    service_date = _date_key(service_date)
+    state = rebuild_state()
+    if state is None:
+        return None
+
+    trains = sorted(
+        ((tid, train) for tid, train in state["trains"].items() if train.get("service_date") == service_date),
+        key=lambda item: (item[1]["departure_minute"], item[0])
+    )
+    carriages_by_train = {}
+    for carriage_id, row in sorted(state["carriages"].items(), key=lambda item: item[1]["position"]):
+        carriages_by_train.setdefault(row["train_id"], []).append((carriage_id, row))
+
+    return [
+        {
+            "id": train_id,
             "departure_time": train["departure_time"],
+            "departure_minute": train["departure_minute"],
             "cancelled": bool(train["cancelled"]),
             "party_train": bool(train["party_train"]),
             "school_name": train["school_name"],
+            "service_date": train["service_date"],
             "carriages": [
                 {
-                    "id": c["id"],
+                    "id": carriage_id,
                     "number": c["number"],
+                    "position": c["position"],
                     "capacity": c["capacity"],
                     "occupied": bool(c["occupied"]),
                     "group_size": c["group_size"],
                     "toddlers": c["toddlers"],
                     "wheelchair": bool(c["wheelchair"]),
-                    "group_id": c["group_id"],
+                    "group_id": c["group_id"] or 0,
+                    "accessible": accessibility(c)[0],
+                    "wheelchair_capacity": accessibility(c)[1],
                 }
-                for c in carriages
+                for carriage_id, c in carriages_by_train.get(train_id, [])
             ]
-        })
+        }
+        for train_id, train in trains
+    ]
 
-    conn.close()
-    return schedule
+def restore_from_journal():
+    # Rewrites trains and carriages from the journal, e.g. after the tables were damaged or lost
+    state = rebuild_state()
+    if state is None:
+        return False
 
-def create_notes_table():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS daily_notes (
-        date TEXT NOT NULL,
-        key TEXT NOT NULL,
-        value TEXT,
-        PRIMARY KEY (date, key)
-    )
-    """)
-    conn.commit()
-    conn.close()
+    with transaction(immediate=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM carriages")
+        cursor.execute("DELETE FROM trains")
+        now = datetime.utcnow().isoformat()
+        group_ids = {row["group_id"] for row in state["carriages"].values() if row["group_id"]}
+        cursor.executemany(
+            "INSERT OR IGNORE INTO groups (id, created_at, source) VALUES (?, ?, 'legacy')",
+            [(gid, now) for gid in group_ids]
+        )
+        _apply_changes(cursor, [["trains", tid, None, row] for tid, row in state["trains"].items()])
+        _apply_changes(cursor, [["carriages", cid, None, row] for cid, row in state["carriages"].items()])
 
-def create_presets_table():
+    bump_schedule_version()
+    return True
+
+def list_events(limit=50):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS presets (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
-        schedule TEXT NOT NULL,
-        created_at TEXT NOT NULL
+    cursor = conn.execute(
+        "SELECT id, event_type, payload, created_at FROM booking_events ORDER BY id DESC LIMIT ?", (limit,)
     )
-    """)
-    conn.commit()
-    conn.close()
+    events = []
+    for row in cursor.fetchall():
+        payload = json.loads(row["payload"])
+        events.append({
+            "id": row["id"],
+            "event_type": row["event_type"],
+            "created_at": row["created_at"],
+            "details": payload["details"],
+            "rows_changed": len(payload["changes"]),
+        })
+    return events
+
+def undo_last_event():
+    # Reverts the newest event that hasn't been undone yet, as long as nothing has touched its rows since
+    with transaction(immediate=True) as conn:
+        cursor = conn.cursor()
+        row = cursor.execute("""
+        SELECT id, event_type, payload FROM booking_events
+        WHERE undone_by IS NULL AND event_type != 'Undo'
+        ORDER BY id DESC LIMIT 1
+        """).fetchone()
+        if row is None:
+            return None
+
+        event_id, event_type, changes = row["id"], row["event_type"], json.loads(row["payload"])["changes"]
+        for table, row_id, _, after in changes:
+            current = _select_rows(cursor, table, "WHERE id = ?", (row_id,)).get(row_id)
+            if after is None:
+                if current is not None:
+                    return None
+            elif current is None or any(
+                dict(zip(TABLE_COLUMNS[table], current)).get(k) != v for k, v in after.items()
+            ):
+                return None
 
-from datetime import datetime, date
+        _apply_changes(cursor, changes, undo=True)
+        inverse = [[table, row_id, after, before] for table, row_id, before, after in reversed(changes)]
+        undo_id = _record_event(cursor, "Undo", inverse, {"undoes": event_id, "event_type": event_type})
+        cursor.execute("UPDATE booking_events SET undone_by = ? WHERE id = ?", (undo_id, event_id))
+
+    bump_schedule_version()
+    return event_type
+
+from datetime import datetime
 
 def save_notes_to_db(note_date, notes_dict):
-    if note_date < date.today():
+    if note_date < today():
         return  # Do not save past notes
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    for key, value in notes_dict.items():
-        cursor.execute("""
+    with transaction() as conn:
+        conn.executemany("""
         INSERT INTO daily_notes (date, key, value)
         VALUES (?, ?, ?)
         ON CONFLICT(date, key) DO UPDATE SET value = excluded.value
-        """, (note_date.isoformat(), key, value.strip()))
-    conn.commit()
-    conn.close()
+        """, [(note_date.isoformat(), key, value.strip()) for key, value in notes_dict.items()])
 
 def load_notes_from_db(note_date, all_keys):
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT key, value FROM daily_notes WHERE date = ?", (note_date.isoformat(),))
     rows = cursor.fetchall()
-    conn.close()
 
     # Create a complete dict with all keys
     return {key: dict(rows).get(key, "") for key in all_keys}
@@ -168,7 +1137,6 @@ def list_presets():
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM presets ORDER BY created_at DESC")
     rows = cursor.fetchall()
-    conn.close()
     return [row["name"] for row in rows]
 
 def load_preset(name):
@@ -176,66 +1144,61 @@ def load_preset(name):
     cursor = conn.cursor()
     cursor.execute("SELECT schedule FROM presets WHERE name = ?", (name,))
     row = cursor.fetchone()
-    conn.close()
     if row:
         return json.loads(row["schedule"])
     else:
         return None
 
 def save_preset(name, schedule):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     schedule_json = json.dumps(schedule)
     now = datetime.utcnow().isoformat()
-    try:
-        cursor.execute("INSERT INTO presets (name, schedule, created_at) VALUES (?, ?, ?)",
-                       (name, schedule_json, now))
-    except sqlite3.IntegrityError:
-        cursor.execute("UPDATE presets SET schedule = ?, created_at = ? WHERE name = ?",
-                       (schedule_json, now, name))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO presets (name, schedule, created_at) VALUES (?, ?, ?)",
+                           (name, schedule_json, now))
+        except sqlite3.IntegrityError:
+            cursor.execute("UPDATE presets SET schedule = ?, created_at = ? WHERE name = ?",
+                           (schedule_json, now, name))
 
 def delete_preset(name):
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM presets WHERE name = ?", (name,))
     affected = cursor.rowcount
-    conn.commit()
-    conn.close()
     return affected > 0
 
 def delete_old_notes():
-    today = date.today().isoformat()
+    today_key = today().isoformat()
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM daily_notes WHERE date < ?", (today,))
-    conn.commit()
-    conn.close()
-
-def init_custom_question_table():
-    with get_db_connection() as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS custom_questions (
-                id TEXT PRIMARY KEY,
-                text TEXT NOT NULL
-            )
-        """)
-        conn.commit()
+    cursor.execute("DELETE FROM daily_notes WHERE date < ?", (today_key,))
 
 def load_custom_questions():
-    init_custom_question_table()
-    with get_db_connection() as conn:
-        cursor = conn.execute("SELECT id, text FROM custom_questions")
-        return {row[0]: row[1] for row in cursor.fetchall()}
+    conn = get_db_connection()
+    cursor = conn.execute("SELECT id, text FROM custom_questions")
+    return {row[0]: row[1] for row in cursor.fetchall()}
 
 def save_custom_question(q_id, q_text):
-    init_custom_question_table()
-    with get_db_connection() as conn:
-        conn.execute("INSERT OR REPLACE INTO custom_questions (id, text) VALUES (?, ?)", (q_id, q_text))
-        conn.commit()
+    conn = get_db_connection()
+    conn.execute("INSERT OR REPLACE INTO custom_questions (id, text) VALUES (?, ?)", (q_id, q_text))
 
 def delete_custom_question(q_id):
-    with get_db_connection() as conn:
-        conn.execute("DELETE FROM custom_questions WHERE id = ?", (q_id,))
-        conn.commit()
\ No newline at end of file
+    conn = get_db_connection()
+    conn.execute("DELETE FROM custom_questions WHERE id = ?", (q_id,))
+
+def load_allocation_policy():
+    # The policy JSON staff saved, or None to use the shipped file
+    conn = get_db_connection()
+    row = conn.execute("SELECT policy FROM allocation_policy WHERE id = 1").fetchone()
+    return row["policy"] if row else None
+
+def save_allocation_policy(policy_text):
+    with transaction() as conn:
+        if policy_text is None:
+            conn.execute("DELETE FROM allocation_policy WHERE id = 1")
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO allocation_policy (id, policy, updated_at) VALUES (1, ?, ?)",
+                (policy_text, datetime.utcnow().isoformat())
+            )
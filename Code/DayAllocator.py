@@ -0,0 +1,140 @@
+import threading
+import numpy as np
+
+from Code.Occupancy import accessibility
+from Code.Policy import current_policy
+
+# Allocators are read-only once built, so every booking against the same cached schedule shares one
+_allocators_lock = threading.Lock()
+_allocators = {}  # (schedule version, service date, from minute) -> DayAllocator
+
+def _seats_lost(carriage):
+    accessible, seats = accessibility(carriage)
+    return carriage["capacity"] - seats if accessible else -1
+
+class DaySchedule(list):
+    # A list of trains that remembers which cached state it was loaded from, or None if unknown
+    def __init__(self, trains, state_key=None):
+        super().__init__(trains)
+        self.state_key = state_key
+
+def allocator_for(schedule):
+    state_key = getattr(schedule, "state_key", None)
+    if state_key is None:
+        return DayAllocator(schedule)
+
+    with _allocators_lock:
+        allocator = _allocators.get(state_key)
+    if allocator is None:
+        allocator = DayAllocator(schedule)
+        with _allocators_lock:
+            # Older versions can never be asked for again
+            for key in [k for k in _allocators if k[0] != state_key[0]]:
+                del _allocators[key]
+            _allocators[state_key] = allocator
+    return allocator
+
+# The whole day's occupancy as trains × carriages arrays, so a group can be screened against every
+# train in a few array operations. The screens only rule trains out when the per-train handlers
+# could not place the group there, so running the handlers on the remaining trains in order gives
+# exactly the same booking as trying every train. Seats taken after the arrays were built only add
+# candidates the handlers then turn down, so a shared allocator never hides a free seat.
+class DayAllocator:
+    def __init__(self, schedule):
+        width = max((len(train["carriages"]) for train in schedule), default=0)
+        padding = [{"number": "", "capacity": 0, "occupied": True}]
+
+        # Carriages in list order, padded with occupied zero-seat slots
+        rows = [train["carriages"] + padding * (width - len(train["carriages"])) for train in schedule]
+        self.capacity = np.array([[c["capacity"] for c in row] for row in rows], dtype=np.int64).reshape(len(rows), width)
+        self.free = np.array(
+            [[not c.get("occupied", False) for c in row] for row in rows], dtype=bool
+        ).reshape(len(rows), width)
+        self.number = np.array([[c["number"] for c in row] for row in rows], dtype=object).reshape(len(rows), width)
+        self.departure_minute = np.array([train["departure_minute"] for train in schedule], dtype=np.int64)
+
+        # Carriages at the column of their number, so adjacent columns are consecutive carriages (as WC sees them).
+        # Later carriages with the same number win, as in WC's carriage map
+        by_number = [{int(c["number"]): c for c in train["carriages"]} for train in schedule]
+        by_number_width = max((max(row, default=0) + 1 for row in by_number), default=1)
+        self.capacity_by_number = np.zeros((len(rows), by_number_width), dtype=np.int64)
+        self.free_by_number = np.zeros((len(rows), by_number_width), dtype=bool)
+        # Seats an accessible carriage gives up with a wheelchair aboard, -1 where it takes no wheelchair
+        self.seats_lost_by_number = np.full((len(rows), by_number_width), -1, dtype=np.int64)
+        for t, row in enumerate(by_number):
+            if row:
+                columns = list(row)
+                self.capacity_by_number[t, columns] = [c["capacity"] for c in row.values()]
+                self.free_by_number[t, columns] = [not c.get("occupied", False) for c in row.values()]
+                self.seats_lost_by_number[t, columns] = [_seats_lost(c) for c in row.values()]
+
+        self.free_capacity = np.where(self.free, self.capacity, 0)
+
+    def minutes_until(self, seconds_of_day):
+        return (self.departure_minute * 60 - seconds_of_day + 59) // 60
+
+    def candidate_trains(self, group_size, adults, wheelchair_count, restricted_carriages=None, eligible=None, policy=None):
+        # Indexes of the trains, in schedule order, where the group might still be placed
+        band = (policy or current_policy()).band_for(group_size)
+        trains = len(self.departure_minute)
+        possible = np.ones(trains, dtype=bool) if eligible is None else np.asarray(eligible, dtype=bool)
+
+        if restricted_carriages is not None:
+            restricted = np.isin(self.number, list(restricted_carriages))
+            possible &= np.where(restricted, self.free_capacity, 0).sum(axis=1) >= group_size
+        elif wheelchair_count > 0:
+            possible &= self._wheelchair_fits(group_size, adults, wheelchair_count)
+        elif band.handler == "small":
+            possible &= adults >= 1
+            possible &= (self.free & (self.capacity >= group_size)).any(axis=1)
+        elif band.handler == "medium":
+            # Only the carriages the band's rules ever use
+            usable = np.isin(self.number, list(band.preferences + band.only_pair + band.confirm))
+            possible &= adults >= 1
+            possible &= (self.free & usable & (self.capacity >= group_size)).any(axis=1)
+        else:
+            possible &= self._contiguous_fits(group_size, adults)
+
+        return np.flatnonzero(possible).tolist()
+
+    def _contiguous_fits(self, group_size, adults):
+        # A run of at most `adults` adjacent free carriages with enough seats, as BestFit needs
+        trains, width = self.free.shape
+        fits = np.zeros(trains, dtype=bool)
+        if width == 0:
+            return fits
+
+        free_count = np.zeros((trains, width + 1), dtype=np.int64)
+        seats = np.zeros((trains, width + 1), dtype=np.int64)
+        free_count[:, 1:] = np.cumsum(self.free, axis=1)
+        seats[:, 1:] = np.cumsum(self.free_capacity, axis=1)
+
+        for length in range(1, min(adults, width) + 1):
+            all_free = free_count[:, length:] - free_count[:, :-length] == length
+            enough = seats[:, length:] - seats[:, :-length] >= group_size
+            fits |= (all_free & enough).any(axis=1)
+        return fits
+
+    def _wheelchair_fits(self, group_size, adults, wheelchair_count):
+        trains, width = self.free_by_number.shape
+        if adults < wheelchair_count:
+            return np.zeros(trains, dtype=bool)
+
+        free_accessible = self.free_by_number & (self.seats_lost_by_number >= 0)
+        fits = free_accessible.sum(axis=1) >= wheelchair_count
+
+        # Every wheelchair costs at least the fewest seats any free accessible carriage on the train loses
+        fewest_lost = np.where(free_accessible, self.seats_lost_by_number, self.capacity_by_number.max(initial=0))
+        fewest_lost = np.where(fits, fewest_lost.min(axis=1, initial=self.capacity_by_number.max(initial=0)), 0)
+
+        # Walk the carriages in number order keeping the seats and accessible carriages of the free
+        # run so far; some run must hold the group and the wheelchairs
+        run_seats = np.zeros(trains, dtype=np.int64)
+        run_accessible = np.zeros(trains, dtype=np.int64)
+        any_run = np.zeros(trains, dtype=bool)
+        for column in range(width):
+            free = self.free_by_number[:, column]
+            run_seats = np.where(free, run_seats + self.capacity_by_number[:, column], 0)
+            run_accessible = np.where(free, run_accessible + free_accessible[:, column], 0)
+            any_run |= (run_accessible >= wheelchair_count) & (run_seats - wheelchair_count * fewest_lost >= group_size)
+        return fits & any_run
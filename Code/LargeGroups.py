@@ -1,21 +1,25 @@
 from Code.BestFit import BestFit
 
 class LargeGroupHandler:
-    def __init__(self, group, adults, carriages, train, st_module, group_id, confirmation_callback=None):
+    def __init__(self, group, adults, carriages, train, group_id, confirmation_callback=None, options=None):
         self.group = group
         self.adults = adults
         self.carriages = carriages
         self.train = train
-        self.st = st_module
         self.group_id = group_id
         self.confirmation_callback = confirmation_callback
+        self.options = options
 
     def assign(self):
         group_size = self.group["size"]
         adults = self.adults
         toddlers = self.group.get("toddlers", 0)
 
-        best_fit_result, carriage_count = BestFit.bestFit(self.carriages, group_size)
+        best_fit_result, carriage_count = BestFit.bestFit(
+            self.carriages, group_size, self.train.get("id"),
+            no_1_4_5_8=self.options.no_1_4_5_8_for_group if self.options else False,
+            options=self.options
+        )
 
         if not best_fit_result:
             return False  # No suitable set of carriages found
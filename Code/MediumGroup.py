@@ -1,4 +1,6 @@
-from Code.Utils import only_c4_c5_available, only_c1_c8_available
+from Code.Occupancy import TrainOccupancy
+from Code.Utils import only_pair_available
+from Code.Policy import policy_for, compiled_band
 
 class MediumGroupHandler:
     def __init__(self, **kwargs):
@@ -7,7 +9,7 @@ class MediumGroupHandler:
         self.group = kwargs.get("group")
         self.carriages = kwargs.get("carriages")
         self.train = kwargs.get("train")
-        self.st_module = kwargs.get("st_module")
+        self.options = kwargs.get("options")
         self.group_id = kwargs.get("group_id")
 
     def assign(self):
@@ -16,30 +18,27 @@ class MediumGroupHandler:
         group_size = self.group["size"]
         toddlers = self.group.get("toddlers", 0)
 
-        # Try preferred carriages first
-        priority_order = ["2", "3", "6", "7"]
-        fallback_order = ["1", "8"]
-
-        # Try priority carriages
-        for number in priority_order + fallback_order:
-            for carriage in self.carriages:
-                if carriage["number"] == number and not carriage.get("occupied", False) and group_size <= carriage["capacity"]:
-                    return self._assign_to_carriage(carriage)
-
-        # Check if only carriages 4 and 5 are available
-        if only_c4_c5_available(self.carriages, group_size):
-            for number in ["4", "5"]:
-                for carriage in self.carriages:
-                    if carriage["number"] == number and not carriage.get("occupied", False) and group_size <= carriage["capacity"]:
-                        return self._assign_to_carriage(carriage)
-
-        # Else: consider 4/5 with confirmation, but only if at least 2 adults
-        if self.adults >= 2:
-            for number in ["4", "5"]:
-                for carriage in self.carriages:
-                    if carriage["number"] == number and not carriage.get("occupied", False) and group_size <= carriage["capacity"]:
-                        if self.confirmation_callback(carriage["number"], self.group_id):
-                            return self._assign_to_carriage(carriage)
+        occupancy = TrainOccupancy(self.carriages)
+        band = policy_for(self.options).band_for(group_size)
+        rules = compiled_band(band, self.carriages)
+        fitting = occupancy.free & rules.fitting(group_size)
+
+        # Try the policy's preferred carriages first
+        position = rules.preferences.first(fitting)
+        if position >= 0:
+            return self._assign_to_carriage(occupancy.carriage[position])
+
+        # Use the pair without asking when nothing else on the train can take the group
+        if band.only_pair and only_pair_available(occupancy, band.only_pair, group_size):
+            position = rules.only_pair.first(fitting)
+            if position >= 0:
+                return self._assign_to_carriage(occupancy.carriage[position])
+
+        # Else: consider the confirm carriages, but only with enough adults
+        if self.adults >= band.confirm_min_adults:
+            for position in rules.confirm:
+                if fitting >> position & 1 and self.confirmation_callback(self.train, occupancy.carriage[position]):
+                    return self._assign_to_carriage(occupancy.carriage[position])
 
         # No assignment possible
         return False
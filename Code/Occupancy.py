@@ -0,0 +1,167 @@
+import threading
+
+# Carriages fitted for a wheelchair, and their seats with one aboard, for carriages saved before
+# accessibility was recorded per carriage
+DEFAULT_WHEELCHAIR_CAPACITY = {"2": 3}
+
+def accessibility(carriage):
+    # (takes a wheelchair, seats left with one aboard)
+    if "accessible" in carriage:
+        return bool(carriage["accessible"]), carriage.get("wheelchair_capacity", 0)
+    number = carriage["number"]
+    return number in DEFAULT_WHEELCHAIR_CAPACITY, DEFAULT_WHEELCHAIR_CAPACITY.get(number, 0)
+
+# Occupancy models reused between bookings, so only carriages that changed update the run index
+REGISTRY_SIZE = 256
+_registry_lock = threading.Lock()
+_registry = {}  # (train id, layout) -> TrainOccupancy
+
+# Compact view of one train's carriages for the allocators.
+# Bit p of `free` is set while the carriage at position p is unoccupied. Positions default to the
+# list order; WC places each carriage at its number so that runs of bits are consecutive numbers.
+# `runs` indexes the maximal runs of free positions by their start and is kept up to date by
+# occupy() and release(). The carriage dicts are only written when a group is actually placed.
+class TrainOccupancy:
+    def __init__(self, carriages, positions=None):
+        if positions is None:
+            positions = range(len(carriages))
+
+        self.positions = list(positions)
+        self.free = 0
+        self.capacity = {}  # position -> seats
+        self.number = {}  # position -> carriage number
+        self.carriage = {}  # position -> carriage dict
+        self.position_of = {}  # carriage number -> position of the first carriage with it
+        self.wheelchair_capacity = {}  # position -> seats with a wheelchair aboard, for accessible carriages
+
+        for position, carriage in zip(self.positions, carriages):
+            self.capacity[position] = carriage["capacity"]
+            self.number[position] = carriage["number"]
+            self.carriage[position] = carriage
+            self.position_of.setdefault(carriage["number"], position)
+            accessible, seats = accessibility(carriage)
+            if accessible:
+                self.wheelchair_capacity[position] = seats
+            if not carriage.get("occupied", False):
+                self.free |= 1 << position
+            else:
+                self.free &= ~(1 << position)
+
+        self.runs = {start: self._summarise(start, end) for start, end in self.free_runs()}
+
+    def is_free(self, position):
+        return bool(self.free >> position & 1)
+
+    def number_free(self, number):
+        position = self.position_of.get(number)
+        return position is not None and self.is_free(position)
+
+    def mask(self, numbers):
+        # Positions of the given carriage numbers as a bitmask
+        mask = 0
+        for number in numbers:
+            if number in self.position_of:
+                mask |= 1 << self.position_of[number]
+        return mask
+
+    def free_positions(self, mask=-1):
+        bits = self.free & mask
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def free_capacity(self, mask=-1):
+        return sum(self.capacity[p] for p in self.free_positions(mask))
+
+    def free_runs(self):
+        # Maximal runs of adjacent free positions as (start, end) with end exclusive
+        bits = self.free
+        while bits:
+            start = (bits & -bits).bit_length() - 1
+            shifted = bits >> start
+            length = (~shifted & (shifted + 1)).bit_length() - 1
+            yield start, start + length
+            bits &= ~(((1 << length) - 1) << start)
+
+    def qualifying_runs(self, min_capacity, min_accessible=0):
+        # Runs in carriage order that could seat the group on their own
+        return [
+            self.runs[start] for start in sorted(self.runs)
+            if self.runs[start]["capacity"] >= min_capacity and self.runs[start]["accessible"] >= min_accessible
+        ]
+
+    def _summarise(self, start, end):
+        run = {"start": start, "end": end, "capacity": 0, "accessible": 0}
+        for position in range(start, end):
+            run["capacity"] += self.capacity[position]
+            if position in self.wheelchair_capacity:
+                run["accessible"] += 1
+        return run
+
+    def _run_containing(self, position):
+        return next((run for run in self.runs.values() if run["start"] <= position < run["end"]), None)
+
+    def occupy(self, position):
+        if not self.is_free(position):
+            return
+        self.free &= ~(1 << position)
+
+        # Split the run the carriage was in
+        run = self._run_containing(position)
+        del self.runs[run["start"]]
+        if run["start"] < position:
+            self.runs[run["start"]] = self._summarise(run["start"], position)
+        if position + 1 < run["end"]:
+            self.runs[position + 1] = self._summarise(position + 1, run["end"])
+
+    def release(self, position):
+        if position not in self.capacity or self.is_free(position):
+            return
+        self.free |= 1 << position
+
+        # Join the runs either side of the carriage
+        start, end = position, position + 1
+        before = self._run_containing(position - 1)
+        if before:
+            start = before["start"]
+            del self.runs[start]
+        after = self.runs.pop(position + 1, None)
+        if after:
+            end = after["end"]
+        self.runs[start] = self._summarise(start, end)
+
+    def sync(self, carriages):
+        # Apply whatever changed in the carriage dicts since this model last saw them
+        for position, carriage in zip(self.positions, carriages):
+            self.carriage[position] = carriage
+            if carriage.get("occupied", False):
+                self.occupy(position)
+            else:
+                self.release(position)
+
+    def copy(self):
+        clone = TrainOccupancy.__new__(TrainOccupancy)
+        clone.__dict__.update(self.__dict__)
+        clone.carriage = dict(self.carriage)
+        clone.runs = {start: dict(run) for start, run in self.runs.items()}
+        return clone
+
+def occupancy_for(train_id, carriages, positions=None):
+    # A private copy of the train's occupancy, brought up to date from the registry when possible
+    if positions is None:
+        positions = range(len(carriages))
+    positions = list(positions)
+    if train_id is None:
+        return TrainOccupancy(carriages, positions)
+
+    key = (train_id, tuple((p, c["number"], c["capacity"], accessibility(c)) for p, c in zip(positions, carriages)))
+    with _registry_lock:
+        occupancy = _registry.get(key)
+        if occupancy is None:
+            if len(_registry) >= REGISTRY_SIZE:
+                _registry.clear()
+            occupancy = _registry[key] = TrainOccupancy(carriages, positions)
+        else:
+            occupancy.sync(carriages)
+        return occupancy.copy()
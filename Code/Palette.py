@@ -0,0 +1,14 @@
+# Matplotlib's tab20 colours, written out so drawing a page never imports matplotlib
+TAB20 = (
+    "#1f77b4", "#aec7e8", "#ff7f0e", "#ffbb78", "#2ca02c", "#98df8a", "#d62728", "#ff9896",
+    "#9467bd", "#c5b0d5", "#8c564b", "#c49c94", "#e377c2", "#f7b6d2", "#7f7f7f", "#c7c7c7",
+    "#bcbd22", "#dbdb8d", "#17becf", "#9edae5",
+)
+EMPTY_COLOUR = "#eee"
+
+def group_colour(group_id):
+    # A group keeps its colour for good, whatever else is booked or removed. Ids close together
+    # (groups booked around the same time, so often on the same train) get different colours.
+    if not group_id:
+        return EMPTY_COLOUR
+    return TAB20[group_id % len(TAB20)]
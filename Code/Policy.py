@@ -0,0 +1,181 @@
+import json
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+# The rules shipped with the app. Staff can save an override from the Schedule Presets page, which the
+# app installs with set_policy(); without one (or without a database at all) the shipped rules apply.
+POLICY_FILE = Path(__file__).with_name("policy.json")
+HANDLERS = ("small", "medium", "large")
+
+# Masks bigger than this are scanned instead of looked up in a table
+TABLE_WIDTH = 12
+
+_policy_lock = threading.Lock()
+_policy = {"current": None}
+
+# One band of group sizes and where the rules seat them. Policies are compared by identity so a
+# reloaded policy never shares cached decisions with the one it replaced.
+@dataclass(frozen=True, eq=False)
+class Band:
+    handler: str  # "small", "medium" or "large"
+    max_size: int = None  # Largest group in the band, None for no limit
+    preferences: tuple = ()  # Carriage numbers tried in order
+    only_pair: tuple = ()  # Taken without asking when nothing else on the train seats the group
+    confirm: tuple = ()  # Taken only once staff agree
+    confirm_min_adults: int = 2
+    split_pairs: tuple = ()  # Pairs a group may be split over once staff agree
+    split_min_adults: int = 2
+    two_seat_carriages: tuple = ()  # Where the group goes if staff turn down a bigger carriage
+    restricted_on_request: tuple = ()  # Left out when staff ask to keep these free
+    avoid: tuple = ()  # Only spilled into when nothing else fits
+
+@dataclass(frozen=True, eq=False)
+class Policy:
+    bands: tuple
+    band_by_size: tuple  # Group size -> band, up to the largest bounded size
+
+    def band_for(self, size):
+        if size < len(self.band_by_size):
+            return self.band_by_size[size]
+        return self.bands[-1]
+
+    def band(self, handler):
+        return next((b for b in self.bands if b.handler == handler), None)
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def parse_policy(text):
+    # Raises ValueError when the text isn't a usable policy
+    try:
+        data = json.loads(text)
+        bands = []
+        for entry in data["bands"]:
+            entry = dict(entry)
+            for key, value in entry.items():
+                if isinstance(value, list):
+                    entry[key] = tuple(tuple(v) if isinstance(v, list) else str(v) for v in value)
+            bands.append(Band(**entry))
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Malformed policy: {e}") from e
+
+    if not bands:
+        raise ValueError("A policy needs at least one band")
+    if bands[-1].max_size is not None:
+        raise ValueError("The last band must have no max_size")
+    if any(b.handler not in HANDLERS for b in bands):
+        raise ValueError(f"Band handlers must be one of {', '.join(HANDLERS)}")
+    sizes = [b.max_size for b in bands[:-1]]
+    if not all(_is_count(size) and size > 0 for size in sizes):
+        raise ValueError("Every band but the last needs a max_size that is a whole number above 0")
+    if any(a >= b for a, b in zip(sizes, sizes[1:])):
+        raise ValueError("Bands must be in increasing max_size order")
+    if not all(_is_count(b.confirm_min_adults) and _is_count(b.split_min_adults) for b in bands):
+        raise ValueError("confirm_min_adults and split_min_adults must be whole numbers")
+
+    band_by_size = []
+    for band in bands[:-1]:
+        while len(band_by_size) <= band.max_size:
+            band_by_size.append(band)
+    return Policy(tuple(bands), tuple(band_by_size))
+
+def default_policy_text():
+    return POLICY_FILE.read_text()
+
+def load_policy(override=None):
+    # The override text if it is a usable policy, otherwise the shipped file
+    if override:
+        try:
+            return parse_policy(override)
+        except ValueError:
+            pass  # A broken override never stops bookings
+    return parse_policy(default_policy_text())
+
+def set_policy(policy):
+    with _policy_lock:
+        _policy["current"] = policy
+
+def current_policy():
+    with _policy_lock:
+        policy = _policy["current"]
+    if policy is None:
+        policy = load_policy()
+        set_policy(policy)
+    return policy
+
+def policy_for(options):
+    policy = getattr(options, "policy", None)
+    return policy if policy is not None else current_policy()
+
+def _first_table(width, order):
+    # For every mask of positions, the first position in `order` that is set, or -1
+    table = [-1] * (1 << width)
+    for position in reversed(order):
+        bit = 1 << position
+        for mask in range(1 << width):
+            if mask & bit:
+                table[mask] = position
+    return table
+
+class Ranking:
+    # Positions in order of preference, answering "first set position" with one index
+    def __init__(self, width, order):
+        self.order = tuple(order)
+        self.mask = 0
+        for position in self.order:
+            self.mask |= 1 << position
+        self.table = _first_table(width, self.order) if width <= TABLE_WIDTH else None
+
+    def first(self, mask):
+        mask &= self.mask
+        if self.table is not None:
+            return self.table[mask]
+        return next((p for p in self.order if mask >> p & 1), -1)
+
+# A band's rules laid over one train layout: carriage numbers become positions and bitmasks
+class CompiledBand:
+    def __init__(self, band, layout):
+        width = len(layout)
+        position_of = {}
+        for position, (number, _) in enumerate(layout):
+            position_of.setdefault(number, position)
+
+        def positions(numbers):
+            return [position_of[n] for n in numbers if n in position_of]
+
+        def mask(numbers):
+            result = 0
+            for position in positions(numbers):
+                result |= 1 << position
+            return result
+
+        self.band = band
+        self.capacity = [capacity for _, capacity in layout]
+        self.preferences = Ranking(width, positions(band.preferences))
+        self.only_pair = Ranking(width, positions(band.only_pair))
+        self.confirm = tuple(positions(band.confirm))
+        self.two_seat_mask = mask(band.two_seat_carriages)
+        self.restricted_mask = mask(band.restricted_on_request)
+        self.avoid = [number in band.avoid for number, _ in layout]
+        self.smallest = Ranking(width, sorted(range(width), key=lambda p: (self.capacity[p], p)))
+
+        # Positions that seat a group of each size on their own
+        largest = max(self.capacity, default=0)
+        self.fits_mask = [0] * (largest + 1)
+        for size in range(largest + 1):
+            for position, capacity in enumerate(self.capacity):
+                if capacity >= size:
+                    self.fits_mask[size] |= 1 << position
+
+    def fitting(self, size):
+        return self.fits_mask[size] if size < len(self.fits_mask) else 0
+
+@lru_cache(maxsize=256)
+def _compile(band, layout):
+    return CompiledBand(band, layout)
+
+def compiled_band(band, carriages):
+    # Layouts repeat across the day, so each band is compiled once per layout
+    return _compile(band, tuple((c["number"], c["capacity"]) for c in carriages))
@@ -1,12 +1,15 @@
+from Code.Occupancy import TrainOccupancy
+from Code.Policy import policy_for, compiled_band
+
 class SmallGroupHandler:
-    def __init__(self, group, adults, carriages, train, st_module, group_id, confirmation_callback=None):
+    def __init__(self, group, adults, carriages, train, group_id, confirmation_callback=None, options=None):
         self.group = group
         self.adults = adults
         self.carriages = carriages
         self.train = train
-        self.st = st_module
         self.group_id = group_id
         self.confirmation_callback = confirmation_callback
+        self.options = options
 
     def assign(self):
         if self.adults < 1:
@@ -15,27 +18,15 @@ class SmallGroupHandler:
         group_size = self.group["size"]
         toddlers = self.group.get("toddlers", 0)
 
-        best_carriage = None
-
-        # Priority for groups of 1–2
-        priority_order = ["1", "8", "4", "5", "2", "3", "6", "7"]
-
-        for priority_num in priority_order:
-            for carriage in self.carriages:
-                if (carriage["number"] == priority_num 
-                    and not carriage.get("occupied", False) 
-                    and group_size <= carriage["capacity"]):
-                    best_carriage = carriage
-                    break
-            if best_carriage:
-                break
+        occupancy = TrainOccupancy(self.carriages)
+        rules = compiled_band(policy_for(self.options).band_for(group_size), self.carriages)
+        fitting = occupancy.free & rules.fitting(group_size)
 
-        # Fallback: smallest suitable carriage
-        if not best_carriage:
-            for carriage in self.carriages:
-                if not carriage.get("occupied", False) and group_size <= carriage["capacity"]:
-                    if best_carriage is None or carriage["capacity"] < best_carriage["capacity"]:
-                        best_carriage = carriage
+        # The policy's order for groups of 1–2, then the smallest suitable carriage
+        position = rules.preferences.first(fitting)
+        if position < 0:
+            position = rules.smallest.first(fitting)
+        best_carriage = occupancy.carriage[position] if position >= 0 else None
 
         if best_carriage:
             best_carriage["occupied"] = True
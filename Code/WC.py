@@ -1,100 +1,112 @@
+from bisect import insort
+
+from Code.Occupancy import TrainOccupancy, occupancy_for
+
 class WC:
     @staticmethod
-    def wheelchair(wheelchair_count, group_size, adults, toddlers, schedule, st, group_id):
+    def wheelchair(wheelchair_count, group_size, adults, toddlers, schedule, group_id):
         if wheelchair_count == 0 or adults < wheelchair_count:
             return False
 
-        best_option = None  # (waste, train_index, [carriage_numbers])
-
-        for train_index, train in enumerate(schedule):
+        # Trains in departure order; the first with room wins
+        for train in schedule:
             if train.get("cancelled", False) or train.get("party_train", False):
                 continue
 
+            # Each carriage sits at the bit of its number, so adjacent free bits are consecutive carriages
             carriages = sorted(train["carriages"], key=lambda x: int(x["number"]))
-            available_carriages = [
-                c for c in carriages if not c.get("occupied", False)
-            ]
+            occupancy = occupancy_for(train.get("id"), carriages, [int(c["number"]) for c in carriages])
 
-            # Filter for at least enough unoccupied carriage 2s (wheelchair accessible)
-            available_c2s = [c for c in available_carriages if c["number"] == "2"]
-            if len(available_c2s) < wheelchair_count:
-                continue
+            window = WC.best_window(occupancy, wheelchair_count, group_size, adults)
+            if window:
+                WC.seat_group(occupancy, window, wheelchair_count, group_size, toddlers, group_id)
+                return True
 
-            carriage_map = {int(c["number"]): c for c in available_carriages}
-            max_carriage_num = max(carriage_map.keys(), default=0)
-
-            for start in range(1, max_carriage_num + 1):
-                current_group = []
-                total_capacity = 0
-                wc_in_group = 0
-                carriage_nums_used = []
-
-                for num in range(start, max_carriage_num + 1):
-                    if num not in carriage_map:
-                        break  # Must be consecutive
-
-                    carr = carriage_map[num]
-                    capacity = carr["capacity"]
-                    if carr["number"] == "2":
-                        wc_in_group += 1
-                        capacity = 3  # wheelchair reduces usable capacity
-
-                    total_capacity += capacity
-                    current_group.append(carr)
-                    carriage_nums_used.append(num)
-
-                    if total_capacity >= group_size and wc_in_group >= wheelchair_count:
-                        waste = total_capacity - group_size
-                        candidate = (waste, train_index, carriage_nums_used)
-                        if best_option is None or candidate < best_option:
-                            best_option = candidate
-                        break
-
-        if not best_option:
-            return False
+        return False
 
-        # Proceed with assignment
-        _, selected_train_index, carriage_nums = best_option
-
-        # --- NEW CHECK ---
-        if adults < len(carriage_nums):
-            return False
-
-        train = schedule[selected_train_index]
-        remaining_group = group_size
-        remaining_adults = adults
-        remaining_toddlers = toddlers
-        wc_needed = wheelchair_count
+    @staticmethod
+    def _seats_lost(occupancy, position):
+        # Seats an accessible carriage gives up when a wheelchair is aboard
+        return occupancy.capacity[position] - occupancy.wheelchair_capacity[position]
 
-        # Assign carriages
-        for num in carriage_nums:
-            carriage = next(c for c in train["carriages"] if int(c["number"]) == num)
+    @staticmethod
+    def best_window(occupancy, wheelchair_count, group_size, adults):
+        # The adjacent free carriages with the fewest empty seats that hold the group and one
+        # accessible carriage per wheelchair, as (start, end). Wheelchairs go in the accessible
+        # carriages that lose the fewest seats. One pass of a sliding window over each free run.
+        best = None  # (waste, start, end)
+
+        for run in occupancy.qualifying_runs(group_size, wheelchair_count):
+            end = run["start"]
+            capacity = 0
+            losses = []  # Seats lost by each accessible carriage in the window, smallest first
+
+            def seats():
+                return capacity - sum(losses[:wheelchair_count])
+
+            for start in range(run["start"], run["end"]):
+                while end < run["end"] and (end <= start or len(losses) < wheelchair_count or seats() < group_size):
+                    capacity += occupancy.capacity[end]
+                    if end in occupancy.wheelchair_capacity:
+                        insort(losses, WC._seats_lost(occupancy, end))
+                    end += 1
+
+                if len(losses) < wheelchair_count or seats() < group_size:
+                    break  # Later starts only lose seats and carriages
+
+                # Every carriage needs an adult
+                if end - start <= adults:
+                    candidate = (seats() - group_size, start, end)
+                    if best is None or candidate < best:
+                        best = candidate
+
+                capacity -= occupancy.capacity[start]
+                if start in occupancy.wheelchair_capacity:
+                    losses.remove(WC._seats_lost(occupancy, start))
+
+        return best[1:] if best else None
 
-            is_wc = carriage["number"] == "2" and wc_needed > 0
-            max_capacity = 3 if is_wc else carriage["capacity"]
-            assign = min(remaining_group, max_capacity)
+    @staticmethod
+    def seat_group(occupancy, window, wheelchair_count, group_size, toddlers, group_id):
+        start, end = window
+        positions = range(start, end)
+
+        # Wheelchairs go where they cost the fewest seats, earliest carriage first on a tie
+        accessible = [p for p in positions if p in occupancy.wheelchair_capacity]
+        wheelchair_positions = set(sorted(accessible, key=lambda p: WC._seats_lost(occupancy, p))[:wheelchair_count])
+
+        # Each wheelchair user sits in their own carriage first, then the rest fill in carriage order
+        limit = {
+            p: occupancy.wheelchair_capacity[p] if p in wheelchair_positions else occupancy.capacity[p]
+            for p in positions
+        }
+        assigned = {p: 1 if p in wheelchair_positions else 0 for p in positions}
+        remaining_group = group_size - len(wheelchair_positions)
+        for p in positions:
+            extra = min(remaining_group, limit[p] - assigned[p])
+            assigned[p] += extra
+            remaining_group -= extra
 
-            toddlers_in_carriage = min(assign, remaining_toddlers // len(carriage_nums))
-            carriage.update({
+        remaining_toddlers = toddlers
+        for p in positions:
+            toddlers_in_carriage = min(assigned[p], remaining_toddlers // len(positions))
+            occupancy.carriage[p].update({
                 "occupied": True,
                 "group_id": group_id,
-                "group_size": assign,
+                "group_size": assigned[p],
                 "toddlers": toddlers_in_carriage,
-                "wheelchair": is_wc
+                "wheelchair": p in wheelchair_positions
             })
-
-            remaining_group -= assign
             remaining_toddlers -= toddlers_in_carriage
 
-            if is_wc:
-                wc_needed -= 1
-                remaining_adults -= 1  # One adult per wheelchair
-
-        return True
-
     @staticmethod
     def can_fit_wheelchair(train, group_size, adults, toddlers, wheelchair_count):
-        # Simplified version: only check if unoccupied space meets requirements
-        carriages = train["carriages"]
-        available_capacity = sum(c["capacity"] for c in carriages if not c.get("occupied", False))
-        return group_size <= available_capacity and wheelchair_count <= 1
+        # Enough free seats and free accessible carriages on the train as a whole
+        occupancy = TrainOccupancy(train["carriages"])
+        free_accessible = sorted(
+            occupancy.capacity[p] - occupancy.wheelchair_capacity[p]
+            for p in occupancy.free_positions() if p in occupancy.wheelchair_capacity
+        )
+        if adults < wheelchair_count or len(free_accessible) < wheelchair_count:
+            return False
+        return group_size <= occupancy.free_capacity() - sum(free_accessible[:wheelchair_count])
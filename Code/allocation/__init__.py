@@ -0,0 +1,11 @@
+from Code.allocation.options import (
+    AllocationOptions, DEFAULT_OPTIONS,
+    SMALL_GROUP_LARGER_CARRIAGE, ONLY_PAIR_AVAILABLE, SOON_DEPARTING, MEDIUM_GROUP_PAIR
+)
+from Code.allocation.overlay import ScheduleOverlay
+from Code.allocation.decisions import decision_cache_stats, clear_decision_cache
+from Code.allocation.engine import (
+    Confirmation, Placement, Proposal, PROPOSED,
+    propose, place_on_train, apply_placement, group_size, minutes_until
+)
+from Code.allocation.rebalance import Move, Rebalance, MAX_MOVES, plan_rebalance, longest_free_run
@@ -0,0 +1,90 @@
+import threading
+from collections import ChainMap, OrderedDict
+
+from Code.Occupancy import accessibility
+from Code.Policy import policy_for
+from Code.allocation.options import MEDIUM_GROUP_PAIR
+
+# Handler decisions shared by every session. A train's occupancy fits in a few bits, so the same
+# group against the same carriages gives the same decision however often the page reruns.
+DECISION_CACHE_SIZE = 4096
+_decisions_lock = threading.Lock()
+_decisions = OrderedDict()  # key -> ((position, fields), ...) the group takes, or None if it doesn't fit
+_stats = {"hits": 0, "misses": 0, "uncached": 0}
+
+# Stands in for the group id in cached writes
+_GROUP = object()
+_MISSING = object()
+
+def decision_key(train, group, options):
+    carriages = train["carriages"]
+    occupied = 0
+    for position, carriage in enumerate(carriages):
+        if carriage.get("occupied", False):
+            occupied |= 1 << position
+    return (
+        occupied,
+        tuple((c["number"], c["capacity"], accessibility(c)) for c in carriages),
+        bool(train.get("cancelled", False)), bool(train.get("party_train", False)),
+        group["adults"] + group["children"], group["adults"], group["toddlers"], group["wheelchair_count"],
+        options.no_1_4_5_8_for_group, options.answer(MEDIUM_GROUP_PAIR), policy_for(options),
+    )
+
+def decide(train, group, options, ask, group_id, assign):
+    # Places the group on `train` in place with `assign(view, ask)`, reusing an earlier decision
+    # for the same carriages and group when there is one. Decisions that asked staff a question
+    # are never stored, since the answer depends on who is asking.
+    key = decision_key(train, group, options)
+    with _decisions_lock:
+        if key in _decisions:
+            _decisions.move_to_end(key)
+            _stats["hits"] += 1
+            decision = _decisions[key]
+        else:
+            decision = _MISSING
+
+    if decision is _MISSING:
+        asked = []
+
+        def tracked_ask(t, carriage):
+            asked.append(carriage["number"])
+            return ask(t, carriage)
+
+        # Run the handler on a view so its writes can be read back as the decision
+        view = {**train, "carriages": [ChainMap({}, c) for c in train["carriages"]]}
+        decision = None
+        if assign(view, tracked_ask):
+            decision = tuple(
+                (p, tuple((k, _GROUP if k == "group_id" else v) for k, v in c.maps[0].items()))
+                for p, c in enumerate(view["carriages"]) if c.maps[0]
+            )
+
+        with _decisions_lock:
+            if asked:
+                _stats["uncached"] += 1
+            else:
+                _stats["misses"] += 1
+                _decisions[key] = decision
+                if len(_decisions) > DECISION_CACHE_SIZE:
+                    _decisions.popitem(last=False)
+
+    if decision is None:
+        return False
+    for position, fields in decision:
+        train["carriages"][position].update((k, group_id if v is _GROUP else v) for k, v in fields)
+    return True
+
+def decision_cache_stats():
+    with _decisions_lock:
+        looked_up = _stats["hits"] + _stats["misses"] + _stats["uncached"]
+        return {
+            **_stats,
+            "size": len(_decisions),
+            "hit_rate": _stats["hits"] / looked_up if looked_up else 0.0,
+        }
+
+def clear_decision_cache():
+    with _decisions_lock:
+        _decisions.clear()
+        for name in _stats:
+            _stats[name] = 0
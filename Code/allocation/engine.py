@@ -0,0 +1,287 @@
+from dataclasses import dataclass, field
+
+from Code import WC as wc
+from Code.SmallGroup import SmallGroupHandler
+from Code.MediumGroup import MediumGroupHandler
+from Code.LargeGroups import LargeGroupHandler
+from Code.DayAllocator import allocator_for
+from Code.allocation.overlay import ScheduleOverlay
+from Code.allocation.decisions import decide
+from Code.Occupancy import TrainOccupancy
+from Code.Policy import policy_for
+from Code.Utils import only_pair_available
+from Code.allocation.options import (
+    DEFAULT_OPTIONS, SMALL_GROUP_LARGER_CARRIAGE, ONLY_PAIR_AVAILABLE, SOON_DEPARTING, MEDIUM_GROUP_PAIR
+)
+
+# Group id carried by proposed carriages until the group is actually booked
+PROPOSED = -1
+
+HANDLERS = {"small": SmallGroupHandler, "medium": MediumGroupHandler, "large": LargeGroupHandler}
+
+@dataclass(frozen=True)
+class Confirmation:
+    question: str
+    train_index: int
+    departure_time: str
+    minutes: int
+    carriages: tuple = ()  # Carriage numbers the question is about
+
+@dataclass
+class Placement:
+    train_index: int
+    overlay: ScheduleOverlay  # Holds the group's seats as changes over the loaded trains
+
+    @property
+    def train(self):
+        # The train with the group's seats filled in
+        return self.overlay.train(self.train_index)
+
+    @property
+    def carriages(self):
+        # The carriages the group would take
+        return self.overlay.changed_carriages(self.train_index)
+
+@dataclass
+class Proposal:
+    placement: Placement = None
+    confirmations: list = field(default_factory=list)
+
+def group_size(group):
+    return group["adults"] + group["children"]
+
+def minutes_until(train, seconds_of_day):
+    return int((train["departure_minute"] * 60 - seconds_of_day + 59) // 60)
+
+def _copy_train(train):
+    return {**train, "carriages": [dict(c) for c in train["carriages"]]}
+
+def _decline(train, carriage):
+    return False
+
+def _try(overlay, train_index, assign):
+    # Runs `assign` on a view of the train and keeps its changes only if it placed the group
+    view = overlay.view(train_index)
+    if not assign(view):
+        return None
+    overlay.record(train_index, view)
+    return Placement(train_index, overlay)
+
+def apply_placement(trains, placement, group_id):
+    # The trains as they would be once the group is booked under `group_id`
+    trains = list(trains)
+    placed = placement.train
+    for position in placement.overlay.delta.get(placement.train_index, {}):
+        placed["carriages"][position]["group_id"] = group_id
+    trains[placement.train_index] = placed
+    return trains
+
+def place_on_train(train, group, options=DEFAULT_OPTIONS, ask=_decline, group_id=PROPOSED):
+    # The group on a copy of one train under the per-size rules, or None if it doesn't fit there.
+    # `ask(train, carriage)` answers the handlers' own questions.
+    placed = _copy_train(train)
+    return placed if _assign(placed, group, options, ask, group_id) else None
+
+def _assign(placed, group, options, ask, group_id=PROPOSED):
+    # Places the group on `placed` in place under the per-size rules
+    return decide(
+        placed, group, options, ask, group_id,
+        lambda view, tracked_ask: _run_handler(view, group, options, tracked_ask, group_id)
+    )
+
+def _run_handler(placed, group, options, ask, group_id):
+    size = group_size(group)
+
+    if group["wheelchair_count"] > 0:
+        return wc.WC.wheelchair(
+            group["wheelchair_count"], size, group["adults"], group["toddlers"], [placed], group_id
+        )
+
+    handler_class = HANDLERS[policy_for(options).band_for(size).handler]
+    handler = handler_class(
+        group={"size": size, "toddlers": group["toddlers"]},
+        adults=group["adults"],
+        carriages=placed["carriages"],
+        train=placed,
+        group_id=group_id,
+        confirmation_callback=ask,
+        options=options
+    )
+    return handler.assign()
+
+def _place_restricted(placed, group, restricted_carriages):
+    size = group_size(group)
+    carriages = [c for c in placed["carriages"] if c["number"] in restricted_carriages and not c["occupied"]]
+    if sum(c["capacity"] for c in carriages) < size:
+        return False
+
+    if group["wheelchair_count"] > 0:
+        return wc.WC.wheelchair(
+            group["wheelchair_count"], size, group["adults"], group["toddlers"], [placed], PROPOSED
+        )
+
+    remaining = size
+    per = group["toddlers"] // len(carriages)
+    extra = group["toddlers"] % len(carriages)
+    for i, c in enumerate(carriages):
+        assign = min(remaining, c["capacity"])
+        c.update({
+            "occupied": True,
+            "group_size": assign,
+            "toddlers": per + (1 if i < extra else 0),
+            "wheelchair": False,
+            "group_id": PROPOSED
+        })
+        remaining -= assign
+    return True
+
+def _first_fit(trains, group, options, seconds_of_day, ask, confirmed=False, restricted_carriages=None):
+    # Earliest train the group fits on. Trains leaving within the warning threshold are skipped unless confirmed.
+    allocator = allocator_for(trains)
+    eligible = None
+    if not confirmed:
+        eligible = allocator.minutes_until(seconds_of_day) > options.warning_threshold_minutes
+
+    candidates = allocator.candidate_trains(
+        group_size(group), group["adults"], group["wheelchair_count"], restricted_carriages, eligible,
+        policy_for(options)
+    )
+    overlay = ScheduleOverlay(trains)
+    for train_index in candidates:
+        if restricted_carriages is not None:
+            placement = _try(overlay, train_index, lambda view: _place_restricted(view, group, restricted_carriages))
+        else:
+            placement = _try(
+                overlay, train_index,
+                lambda view, i=train_index: _assign(view, group, options, lambda t, c: ask(i, c))
+            )
+        if placement:
+            return placement
+    return None
+
+def _two_seat_only(trains, group, band):
+    # Groups of 1–2 who would rather wait than take a 4-seat carriage
+    size = group_size(group)
+    if group["adults"] < 1:
+        return None
+
+    overlay = ScheduleOverlay(trains)
+    for train_index, train in enumerate(trains):
+        free = [c for c in train["carriages"] if c["number"] in band.two_seat_carriages and not c["occupied"]]
+        if sum(c["capacity"] for c in free) < size:
+            continue
+
+        view = overlay.view(train_index)
+        carriages = [c for c in view["carriages"] if c["number"] in band.two_seat_carriages and not c["occupied"]]
+
+        # The fewest carriages that seat the group
+        remaining = size
+        used_carriages = []
+        for c in carriages:
+            if remaining <= 0:
+                break
+            assign = min(remaining, c["capacity"])
+            used_carriages.append((c, assign))
+            remaining -= assign
+        if remaining > 0:
+            continue
+
+        per = group["toddlers"] // len(used_carriages) if used_carriages else 0
+        extra = group["toddlers"] % len(used_carriages)
+        for i, (c, assign) in enumerate(used_carriages):
+            c.update({
+                "occupied": True,
+                "group_size": assign,
+                "toddlers": per + (1 if i < extra else 0),
+                "wheelchair": group["wheelchair_count"] > 0,
+                "group_id": PROPOSED
+            })
+        overlay.record(train_index, view)
+        return Placement(train_index, overlay)
+
+    return None
+
+def _soon_departing(trains, seconds_of_day, threshold):
+    for train_index, train in enumerate(trains):
+        minutes = minutes_until(train, seconds_of_day)
+        if 0 <= minutes <= threshold and any(not c["occupied"] for c in train["carriages"]):
+            return train_index, minutes
+    return None, None
+
+def _could_fit(train, group, band):
+    size = group_size(group)
+    carriages = train["carriages"]
+
+    if group["wheelchair_count"] > 0:
+        # Needs a free accessible carriage per wheelchair
+        return wc.WC.can_fit_wheelchair(train, size, group["adults"], group["toddlers"], group["wheelchair_count"])
+
+    free = {c["number"] for c in carriages if not c["occupied"]}
+    if group["adults"] >= band.split_min_adults and any(set(pair) <= free for pair in band.split_pairs):
+        return True
+
+    return size <= sum(c["capacity"] for c in carriages if not c["occupied"])
+
+def _only_pair_train(trains, size, pairs):
+    for train_index, train in enumerate(trains):
+        occupancy = TrainOccupancy(train["carriages"])
+        for pair in pairs:
+            if only_pair_available(occupancy, pair, size):
+                return train_index, tuple(pair)
+    return None, None
+
+def propose(trains, group, options=DEFAULT_OPTIONS, seconds_of_day=0):
+    # Where the Booking page would put the group, or what staff must be asked first.
+    # `trains` are the bookable trains in departure order and are never modified.
+    size = group_size(group)
+    adults = group["adults"]
+    band = policy_for(options).band_for(size)
+    confirmations = []
+
+    def confirmation(question, train_index, carriages=()):
+        train = trains[train_index]
+        return Confirmation(question, train_index, train["departure_time"], minutes_until(train, seconds_of_day), carriages)
+
+    def ask(train_index, carriage):
+        answer = options.answer(MEDIUM_GROUP_PAIR)
+        if answer is None:
+            confirmations.append(confirmation(MEDIUM_GROUP_PAIR, train_index, (carriage["number"],)))
+            return False
+        return answer
+
+    def first_fit(**kwargs):
+        return Proposal(_first_fit(trains, group, options, seconds_of_day, ask, **kwargs), confirmations)
+
+    # 1–2 people where a train only has 4-seat carriages left
+    if band.handler == "small" and adults >= 1 and group["wheelchair_count"] == 0:
+        answer = options.answer(SMALL_GROUP_LARGER_CARRIAGE)
+        if answer is None:
+            for train_index, train in enumerate(trains):
+                available = [c for c in train["carriages"] if not c["occupied"]]
+                if not any(c["capacity"] == 2 for c in available) and any(c["capacity"] == 4 for c in available):
+                    return Proposal(None, [confirmation(SMALL_GROUP_LARGER_CARRIAGE, train_index)])
+        elif answer:
+            return first_fit(confirmed=True)
+        else:
+            return Proposal(_two_seat_only(trains, group, band))
+
+    # 3–4 people who can only sit together split over a pair such as carriages 4/5 or 1/8
+    if band.split_pairs and adults >= band.split_min_adults:
+        train_index, pair = _only_pair_train(trains, size, band.split_pairs)
+        if train_index is not None:
+            answer = options.answer(ONLY_PAIR_AVAILABLE)
+            if answer is None:
+                return Proposal(None, [confirmation(ONLY_PAIR_AVAILABLE, train_index, pair)])
+            if answer:
+                return first_fit(confirmed=True, restricted_carriages=list(pair))
+            return first_fit()
+
+    # A train with room is about to leave
+    soon_index, _ = _soon_departing(trains, seconds_of_day, options.warning_threshold_minutes)
+    if soon_index is not None and size != 0 and _could_fit(trains[soon_index], group, band):
+        answer = options.answer(SOON_DEPARTING)
+        if answer is None:
+            return Proposal(None, [confirmation(SOON_DEPARTING, soon_index)])
+        return first_fit(confirmed=answer)
+
+    return first_fit()
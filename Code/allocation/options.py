@@ -0,0 +1,24 @@
+from dataclasses import dataclass, replace
+
+# Questions the engine can put to staff before it places a group
+SMALL_GROUP_LARGER_CARRIAGE = "small_group_larger_carriage"  # 1–2 people into a 4-seat carriage
+ONLY_PAIR_AVAILABLE = "only_pair_available"  # 3–4 people split over carriages 4/5 or 1/8
+SOON_DEPARTING = "soon_departing"  # a train leaving within the warning threshold
+MEDIUM_GROUP_PAIR = "medium_group_pair"  # 3–4 people alone in carriage 4 or 5
+
+@dataclass(frozen=True)
+class AllocationOptions:
+    warning_threshold_minutes: int = 10
+    no_1_4_5_8_for_group: bool = False  # BestFit leaves carriages 1, 4, 5 and 8 out for groups of 3–4
+    answers: tuple = ()  # (question, accepted) pairs staff have already given
+    policy: object = None  # Allocation policy to apply, None for the current one
+
+    def answer(self, question):
+        # True/False, or None if staff haven't been asked yet
+        return dict(self.answers).get(question)
+
+    def with_answer(self, question, accepted):
+        answers = tuple((q, a) for q, a in self.answers if q != question)
+        return replace(self, answers=answers + ((question, accepted),))
+
+DEFAULT_OPTIONS = AllocationOptions()
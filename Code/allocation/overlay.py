@@ -0,0 +1,50 @@
+from collections import ChainMap
+
+# Tentative seat changes over a list of trains, kept as a small delta so the loaded trains are
+# never written. A view of one train has carriages that read through to the loaded ones and keep
+# their own writes, so the handlers can run on it unchanged; record() keeps what a view changed
+# and discard() drops it. Nothing is copied until a changed train is asked for.
+class ScheduleOverlay:
+    def __init__(self, trains):
+        self.trains = trains
+        self.delta = {}  # train index -> {carriage position: changed fields}
+
+    def view(self, train_index):
+        train = self.trains[train_index]
+        changes = self.delta.get(train_index, {})
+        carriages = [ChainMap(dict(changes.get(p, {})), c) for p, c in enumerate(train["carriages"])]
+        return {**train, "carriages": carriages}
+
+    def record(self, train_index, view):
+        changes = {p: c.maps[0] for p, c in enumerate(view["carriages"]) if c.maps[0]}
+        if changes:
+            self.delta[train_index] = changes
+        else:
+            self.delta.pop(train_index, None)
+
+    def discard(self, train_index=None):
+        if train_index is None:
+            self.delta = {}
+        else:
+            self.delta.pop(train_index, None)
+
+    def changed_carriages(self, train_index):
+        # The train's carriages that have recorded changes, with the changes applied
+        carriages = self.trains[train_index]["carriages"]
+        changes = self.delta.get(train_index, {})
+        return [{**carriages[p], **changes[p]} for p in sorted(changes)]
+
+    def train(self, train_index):
+        train = self.trains[train_index]
+        changes = self.delta.get(train_index, {})
+        if not changes:
+            return train
+        carriages = [{**c, **changes[p]} if p in changes else c for p, c in enumerate(train["carriages"])]
+        return {**train, "carriages": carriages}
+
+    def commit(self):
+        # The trains with every recorded change applied; untouched trains are the loaded ones
+        trains = list(self.trains)
+        for train_index in self.delta:
+            trains[train_index] = self.train(train_index)
+        return trains
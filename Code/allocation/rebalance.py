@@ -0,0 +1,148 @@
+from dataclasses import dataclass, replace
+from itertools import combinations
+
+from Code.Occupancy import TrainOccupancy
+from Code.allocation.overlay import ScheduleOverlay
+from Code.allocation.options import DEFAULT_OPTIONS
+from Code.allocation.engine import PROPOSED, Placement, group_size, minutes_until, place_on_train, _copy_train
+
+# Most groups staff are asked to move for one booking
+MAX_MOVES = 3
+
+@dataclass(frozen=True)
+class Move:
+    group_id: int
+    from_train_index: int
+    to_train_index: int
+    from_carriages: tuple  # The carriages the group leaves, as loaded
+    to_carriages: tuple  # The carriages it takes instead, seats filled in
+
+@dataclass
+class Rebalance:
+    moves: list
+    placement: Placement  # The pending group's seats over the trains as they are after the moves
+    seats_recovered: dict  # Train index -> seats gained by its longest run of adjacent free carriages
+
+def longest_free_run(train):
+    # Seats in the biggest run of adjacent free carriages, which is what a large group needs
+    runs = TrainOccupancy(train["carriages"]).runs.values()
+    return max((run["capacity"] for run in runs), default=0)
+
+def _movable(train, groups):
+    # (group id, shape, positions) for each booked group on the train the rules could seat again.
+    # What the group holds must match its booking, since hand-placed groups may sit differently.
+    positions_of = {}
+    for position, carriage in enumerate(train["carriages"]):
+        if carriage["occupied"] and carriage["group_id"] and carriage["group_id"] > 0:
+            positions_of.setdefault(carriage["group_id"], []).append(position)
+
+    movable = []
+    for gid, positions in positions_of.items():
+        row = groups.get(gid)
+        if row is None:
+            continue
+        shape = {k: row[k] for k in ("adults", "children", "toddlers", "wheelchair_count")}
+        if sum(train["carriages"][p]["group_size"] for p in positions) != group_size(shape):
+            continue
+        movable.append((gid, shape, positions))
+    return movable
+
+def _vacate(train, movers):
+    emptied = _copy_train(train)
+    for _, _, positions in movers:
+        for p in positions:
+            emptied["carriages"][p].update({
+                "occupied": False, "group_size": 0, "toddlers": 0, "wheelchair": False, "group_id": 0
+            })
+    return emptied
+
+def _changed(before, after):
+    return tuple(c for c, b in zip(after["carriages"], before["carriages"]) if c != b)
+
+def _try_moves(trains, train_index, movers, group, options, mover_options, destinations):
+    # Empties the movers' carriages and seats the group, then seats each mover again on the same
+    # train or an adjacent one. (moves, {train index: train after}) or None if anyone is left over.
+    emptied = _vacate(trains[train_index], movers)
+    if sum(c["capacity"] for c in emptied["carriages"] if not c["occupied"]) < group_size(group):
+        return None
+    placed = place_on_train(emptied, group, options)
+    if placed is None:
+        return None
+
+    changed = {train_index: placed}
+    moves = []
+    for gid, shape, positions in sorted(movers, key=lambda m: -group_size(m[1])):
+        for to_index in [train_index] + destinations:
+            current = changed.get(to_index, trains[to_index])
+            seated = place_on_train(current, shape, mover_options, group_id=gid)
+            if seated is not None:
+                break
+        else:
+            return None
+        changed[to_index] = seated
+        moves.append(Move(
+            gid, train_index, to_index,
+            tuple(trains[train_index]["carriages"][p] for p in positions), _changed(current, seated)
+        ))
+    return moves, changed
+
+def _result(trains, train_index, moves, changed):
+    # The trains after the moves, with the group's seats held over them as a placement
+    after = list(trains)
+    for index, train in changed.items():
+        after[index] = train
+    pending = {p: c for p, c in enumerate(changed[train_index]["carriages"]) if c["group_id"] == PROPOSED}
+    after[train_index] = _vacate(changed[train_index], [(PROPOSED, None, list(pending))])
+
+    overlay = ScheduleOverlay(after)
+    view = overlay.view(train_index)
+    for p, carriage in pending.items():
+        view["carriages"][p].update(carriage)
+    overlay.record(train_index, view)
+
+    seats_recovered = {
+        index: longest_free_run(after[index]) - longest_free_run(trains[index]) for index in sorted(changed)
+    }
+    return Rebalance(moves, Placement(train_index, overlay), seats_recovered)
+
+def plan_rebalance(trains, group, groups, options=DEFAULT_OPTIONS, seconds_of_day=0, before=None, max_moves=MAX_MOVES):
+    # The fewest moves of booked groups that let `group` sit on a train earlier than `before` (the
+    # train it would otherwise get, None for none), or None. Groups on trains inside the warning
+    # threshold have started boarding and are never moved. `groups` maps group id -> groups row.
+    # Fewer moves win, then moves that stay on the same train, then fewer people moved.
+    if before is None:
+        before = len(trains)
+    size = group_size(group)
+    mover_options = replace(options, no_1_4_5_8_for_group=False, answers=())
+
+    def open_for_moves(index):
+        return 0 <= index < len(trains) and minutes_until(trains[index], seconds_of_day) > options.warning_threshold_minutes
+
+    for train_index in range(before):
+        train = trains[train_index]
+        if not open_for_moves(train_index) or place_on_train(train, group, options) is not None:
+            continue
+        movable = _movable(train, groups)
+        # Even moving the groups holding the most seats can't make room
+        held = sorted((sum(train["carriages"][p]["capacity"] for p in ps) for _, _, ps in movable), reverse=True)
+        free = sum(c["capacity"] for c in train["carriages"] if not c["occupied"])
+        if free + sum(held[:max_moves]) < size:
+            continue
+
+        destinations = [i for i in (train_index + 1, train_index - 1) if open_for_moves(i)]
+        for count in range(1, max_moves + 1):
+            best = None
+            for movers in combinations(movable, count):
+                attempt = _try_moves(trains, train_index, movers, group, options, mover_options, destinations)
+                if attempt is None:
+                    continue
+                moves, changed = attempt
+                score = (
+                    sum(m.to_train_index != train_index for m in moves),
+                    sum(group_size(shape) for _, shape, _ in movers)
+                )
+                if best is None or score < best[0]:
+                    best = (score, moves, changed)
+            if best:
+                return _result(trains, train_index, best[1], best[2])
+    return None
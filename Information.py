@@ -1,12 +1,12 @@
 import streamlit as st
-from datetime import date
 from Code.Database import (
     load_notes_from_db,
     save_notes_to_db,
     delete_old_notes,
     load_custom_questions,
     save_custom_question,
-    delete_custom_question
+    delete_custom_question,
+    today
 )
 
 def information_page():
@@ -40,11 +40,11 @@ def information_page():
         st.session_state["all_questions"] = db_questions
 
     questions = st.session_state["all_questions"]
-    today_key = date.today().isoformat()
+    today_key = today().isoformat()
 
     # --- Show today's notes (read-only) ---
     st.markdown("### 📅 Today's Notes")
-    today_notes = load_notes_from_db(date.today(), list(questions.keys()))
+    today_notes = load_notes_from_db(today(), list(questions.keys()))
 
     with st.expander(f"📅 Notes for Today ({today_key})", expanded=True):
         has_any = False
@@ -63,7 +63,7 @@ def information_page():
     # --- Edit notes for selected date ---
     st.header("📅 Plan for Another Date")
 
-    selected_date = st.date_input("Select a date to plan for", value=date.today())
+    selected_date = st.date_input("Select a date to plan for", value=today(), min_value=today())
     date_key = selected_date.isoformat()
     notes_for_date = load_notes_from_db(selected_date, list(questions.keys()))
 
@@ -0,0 +1,83 @@
+import html
+import streamlit as st
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from Code.Database import load_schedule, get_schedule_version, today
+
+LOCAL = ZoneInfo("Europe/London")
+
+REFRESH_SECONDS = 20
+BOARD_TRAINS = 8  # Departures shown at once
+BOARDING_MINUTES = 10  # Same as the Booking page's warning threshold
+
+BOARD_CSS = """
+<style>
+.board-train { display: flex; align-items: center; gap: 1rem; padding: 0.75rem 0; border-bottom: 1px solid rgba(49, 51, 63, 0.2); }
+.board-time { font-size: 2rem; font-weight: bold; min-width: 8rem; }
+.board-status { font-size: 1.1rem; min-width: 9rem; }
+.board-carriages { display: grid; gap: 0.4rem; flex: 1; }
+.board-carriage { border-radius: 8px; padding: 6px; text-align: center; font-size: 1.1rem; }
+</style>
+"""
+
+
+def format_24_to_12(time_str):
+    return datetime.strptime(time_str, "%H:%M").strftime("%-I:%M %p")
+
+
+def train_status(train, minutes):
+    if train.get('cancelled', False):
+        return "❌ Cancelled"
+    if train.get('party_train', False):
+        return "🎉 Party train"
+    if train.get('school_name', ""):
+        return f"🏫 {html.escape(train['school_name'])}"
+    if minutes <= BOARDING_MINUTES:
+        return f"🟠 Boarding - {minutes} min"
+    return f"in {minutes} min"
+
+
+def train_row(train, minutes):
+    reserved = train.get('cancelled', False) or train.get('party_train', False) or train.get('school_name', "")
+    cells = []
+    for i, carriage in enumerate(train['carriages']):
+        free = 0 if reserved or carriage.get('occupied', False) else carriage['capacity']
+        colour = '#b7e4c7' if free else '#eee'
+        cells.append(
+            f'<div class="board-carriage" style="background-color: {colour};"><b>C{i+1}</b><br>'
+            f'{f"{free} free" if free else "Full"}</div>'
+        )
+    columns = max(len(cells), 8)
+    return (
+        f'<div class="board-train"><div class="board-time">{format_24_to_12(train["departure_time"])}</div>'
+        f'<div class="board-status">{train_status(train, minutes)}</div>'
+        f'<div class="board-carriages" style="grid-template-columns: repeat({columns}, minmax(0, 1fr));">'
+        f'{"".join(cells)}</div></div>'
+    )
+
+
+@lru_cache(maxsize=8)
+def board_html(service_date, version, minute):
+    # Built once per schedule version and minute, however many screens ask for it
+    upcoming = [t for t in load_schedule(service_date) if t['departure_minute'] >= minute][:BOARD_TRAINS]
+    if not upcoming:
+        return "<h3>No more departures today.</h3>"
+    return BOARD_CSS + "".join(train_row(train, train['departure_minute'] - minute) for train in upcoming)
+
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def live_board():
+    now = datetime.now(LOCAL)
+    minute = now.hour * 60 + now.minute
+    st.markdown(board_html(today().isoformat(), get_schedule_version(), minute), unsafe_allow_html=True)
+    st.caption(f"Updated {now.strftime('%-I:%M %p')}")
+
+
+def departure_board_page():
+    st.title("🚆 Departures")
+    live_board()
+
+
+if __name__ == "__main__":
+    departure_board_page()
@@ -1,7 +1,8 @@
 import streamlit as st
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from Code.Database import save_schedule, load_schedule
+from Code.Database import load_schedule, load_train, create_group, delete_group, claim_carriages, today
+from Code.Occupancy import accessibility
 
 LOCAL = ZoneInfo("Europe/London")
 
@@ -34,26 +35,118 @@ def display_assignment_success(schedule, group_id):
             st.success(f"✅ Assigned to {summary}, {details}{extra_str}")
             break
 
-def display_feedback():
-    if st.session_state.get("feedback"):
-        fb = st.session_state.feedback
+def display_feedback(train_id):
+    fb = st.session_state.manual_feedback.pop(train_id, None)
+    if fb:
         if fb["type"] == "success":
             updated_schedule, gid = fb["data"]
             display_assignment_success(updated_schedule, gid)
         elif fb["type"] == "error":
             st.error(fb["data"])
-        st.session_state.feedback = None
 
 def is_future_train(train):
     now = datetime.now(LOCAL)
+    if train['service_date'] != today().isoformat():
+        return train['service_date'] > today().isoformat()
     try:
         dep_time = parse_time_local(train['departure_time']).replace(year=now.year, month=now.month, day=now.day)
         return dep_time >= now
     except:
         return False
 
+def submit_assignment(train, carriage_index):
+    # Runs before the train's block redraws, so the block shows the booking straight away
+    train_id = train['id']
+    carriage = dict(train['carriages'][carriage_index])
+    capacity = carriage.get("capacity", 6)
+    group_size = st.session_state[f"manual_size_{train_id}"]
+    toddlers = st.session_state[f"manual_toddlers_{train_id}"]
+    wheelchair = st.session_state.get(f"manual_wheelchair_{train_id}", False)
+    wheelchair_allowed, wheelchair_capacity = accessibility(carriage)
+
+    if group_size > capacity:
+        feedback = {"type": "error", "data": f"Carriage only supports {capacity} passengers."}
+    elif not wheelchair_allowed and wheelchair:
+        feedback = {"type": "error", "data": "Wheelchair access is only available in accessible carriages."}
+    elif wheelchair and group_size > wheelchair_capacity:
+        feedback = {"type": "error", "data": f"With a wheelchair aboard this carriage only seats {wheelchair_capacity}."}
+    else:
+        # Manual bookings don't split adults and children
+        next_id = create_group(group_size, 0, toddlers, int(wheelchair), source="manual")
+        carriage.update({
+            "group_size": group_size,
+            "group_id": next_id,
+            "occupied": True,
+            "toddlers": toddlers,
+            "wheelchair": wheelchair
+        })
+
+        if claim_carriages(next_id, [carriage]):
+            placed = {**train, "carriages": [carriage if i == carriage_index else c for i, c in enumerate(train['carriages'])]}
+            feedback = {"type": "success", "data": ([placed], next_id)}
+        else:
+            delete_group(next_id)
+            feedback = {"type": "error", "data": f"Carriage {carriage_index + 1} was just booked from another till."}
+
+        # Clear the selection to close the form
+        st.session_state.manual_selection.pop(train_id, None)
+
+    st.session_state.manual_feedback[train_id] = feedback
+
+def assign_form(train, carriage_index):
+    carriage = train['carriages'][carriage_index]
+    capacity = carriage.get("capacity", 6)
+    with st.form(f"assign_form_{train['id']}"):
+        st.number_input("Adults and Children", min_value=1, max_value=capacity, value=2, key=f"manual_size_{train['id']}")
+        st.number_input("Toddlers", min_value=0, max_value=capacity, value=0, key=f"manual_toddlers_{train['id']}")
+
+        wheelchair_allowed, _ = accessibility(carriage)
+        if wheelchair_allowed:
+            st.checkbox("♿ Wheelchair Access Needed", key=f"manual_wheelchair_{train['id']}")
+
+        st.form_submit_button("Assign Group", on_click=submit_assignment, args=(train, carriage_index))
+
+@st.fragment
+def train_block(service_date, train_id):
+    # One train's carriage buttons and form. Clicks rerun only this block, against the cached schedule.
+    train = load_train(service_date, train_id)
+    if train is None:
+        return
+
+    st.subheader(f"⏰ {train['departure_time']}")
+    display_feedback(train_id)
+
+    cols = st.columns(len(train['carriages']))
+    for i, carriage in enumerate(train['carriages']):
+        occupied = carriage.get("occupied", False)
+        capacity = carriage.get("capacity", 6)
+        label = f"🚫 C{i+1}" if occupied else f"🟢 C{i+1}"
+        if accessibility(carriage)[0]:
+            label += " ♿"
+
+        with cols[i]:
+            if st.button(label, key=f"train{train_id}_carriage{i}"):
+                # The form below picks the selection up on this same run
+                st.session_state.manual_feedback.pop(train_id, None)
+                st.session_state.manual_selection[train_id] = i
+            st.caption(f"Size: {capacity}")
+
+    selected_carriage_index = st.session_state.manual_selection.get(train_id)
+    if selected_carriage_index is not None:
+        st.markdown(f"#### 📝 Assign Group to Carriage {selected_carriage_index + 1} at {train['departure_time']}")
+        if train['carriages'][selected_carriage_index].get("occupied", False):
+            st.error(f"Carriage {selected_carriage_index + 1} on train {train['departure_time']} is already occupied.")
+        else:
+            assign_form(train, selected_carriage_index)
+
 def manual_group_assignment_page():
-    schedule = load_schedule()
+    if "manual_selection" not in st.session_state:
+        st.session_state.manual_selection = {}  # train id -> index of the carriage being assigned
+    if "manual_feedback" not in st.session_state:
+        st.session_state.manual_feedback = {}  # train id -> feedback from its last assignment
+
+    service_date = st.date_input("Service Date", value=today(), min_value=today(), key="manual_service_date")
+    schedule = load_schedule(service_date)
     if not schedule:
         st.warning("No schedule loaded")
         return
@@ -66,86 +159,8 @@ def manual_group_assignment_page():
         st.warning("No assignable trains available.")
         return
 
-    selected_train_id = st.session_state.get("selected_train_id", None)
-    selected_carriage_index = st.session_state.get("selected_carriage_index", None)
-
-    if selected_train_id is not None and selected_carriage_index is not None:
-        train = next((t for t in assignable_schedule if t['id'] == selected_train_id), None)
-        if train:
-            st.title(f"📝 Assign Group to Carriage {selected_carriage_index + 1} at {train['departure_time']}")
-            display_feedback()  # Show feedback immediately below the title
-
-            carriage = train['carriages'][selected_carriage_index]
-            if carriage.get("occupied", False):
-                st.error(f"Carriage {selected_carriage_index + 1} on train {train['departure_time']} is already occupied.")
-            else:
-                capacity = carriage.get("capacity", 6)
-                with st.form("assign_form"):
-                    group_size = st.number_input("Adults and Children", min_value=1, max_value=capacity, value=2)
-                    toddlers = st.number_input("Toddlers", min_value=0, max_value=capacity, value=0)
-
-                    wheelchair_allowed = (selected_carriage_index == 1)
-                    wheelchair = st.checkbox("♿ Wheelchair Access Needed") if wheelchair_allowed else False
-
-                    submit = st.form_submit_button("Assign Group")
-
-                    if submit:
-                        # Recompute next_id here for assignment
-                        all_ids = [c.get('group_id') for t in schedule for c in t['carriages'] if c.get('group_id')]
-                        next_id = max(all_ids, default=0) + 1
-
-                        if group_size > capacity:
-                            st.error(f"Carriage only supports {capacity} passengers.")
-                        elif not wheelchair_allowed and wheelchair:
-                            st.error("Wheelchair access is only available in Carriage 2.")
-                        else:
-                            carriage.update({
-                                "group_size": group_size,
-                                "group_id": next_id,
-                                "occupied": True,
-                                "toddlers": toddlers,
-                                "wheelchair": wheelchair
-                            })
-                            for t in schedule:
-                                if t["id"] == train["id"]:
-                                    t["carriages"][selected_carriage_index] = carriage
-                                    break
-
-                            save_schedule(schedule)
-
-                            # Set feedback for success
-                            st.session_state.feedback = {"type": "success", "data": (schedule, next_id)}
-
-                            # Reset selection to clear form
-                            st.session_state.selected_train_id = None
-                            st.session_state.selected_carriage_index = None
-
-                            st.rerun()
-        else:
-            st.title("📝 Manual Group Assignment")
-            display_feedback()
-    else:
-        st.title("📝 Manual Group Assignment")
-        display_feedback()
-
+    st.title("📝 Manual Group Assignment")
     st.markdown("### Select a Train and Carriage")
 
-    for train_idx, train in enumerate(assignable_schedule):
-        dep = train['departure_time']
-        st.subheader(f"⏰ {dep}")
-
-        cols = st.columns(len(train['carriages']))
-        for i, carriage in enumerate(train['carriages']):
-            occupied = carriage.get("occupied", False)
-            capacity = carriage.get("capacity", 6)
-            label = f"🚫 C{i+1}" if occupied else f"🟢 C{i+1}"
-            if i == 1:
-                label += " ♿"
-
-            with cols[i]:
-                if st.button(label, key=f"train{train_idx}_carriage{i}"):
-                    st.session_state.feedback = None
-                    st.session_state.selected_train_id = train['id']
-                    st.session_state.selected_carriage_index = i
-                    st.rerun()
-                st.caption(f"Size: {capacity}")
+    for train in assignable_schedule:
+        train_block(service_date, train['id'])
@@ -1,8 +1,11 @@
+import html
 import streamlit as st
-import matplotlib.cm
+from functools import lru_cache
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from Code.Database import save_schedule, load_schedule
+from Code.Database import save_schedule, load_schedule, time_to_minute, list_events, undo_last_event, today
+from Code.allocation import decision_cache_stats
+from Code.Palette import group_colour, EMPTY_COLOUR
 
 LOCAL = ZoneInfo("Europe/London")
 
@@ -22,41 +25,123 @@ def format_24_to_12(time_str: str) -> str:
         return datetime.strptime(time_str, "%H:%M").strftime("%#I:%M %p")
 
 
-def create_group_colour_map(schedule: list, cmap_name='tab20') -> dict:
-    group_ids = sorted({
-        carriage['group_id']
-        for train in schedule
-        for carriage in train['carriages']
-        if carriage.get('group_size', 0) > 0
-    })
-    cmap = matplotlib.cm.get_cmap(cmap_name, len(group_ids))
+GRID_CSS = """
+<style>
+.overview-train { border-bottom: 1px solid rgba(49, 51, 63, 0.2); padding-bottom: 1rem; margin-bottom: 1rem; }
+.overview-carriages { display: grid; gap: 0.5rem; }
+.overview-carriage { border-radius: 10px; padding: 10px; text-align: center; min-height: 80px; }
+</style>
+"""
+
+
+def train_tags(train: dict) -> tuple:
+    tags = []
+    if train.get('cancelled', False):
+        tags.append("❌ CANCELLED")
+    if train.get('party_train', False):
+        tags.append("🎉 PARTY TRAIN")
+    if train.get('school_name', ""):
+        tags.append(f"🏫🎓 {train['school_name']}")
+    return tuple(tags)
+
+
+def carriage_cell(train: dict, i: int, carriage: dict) -> tuple:
+    # What one carriage shows: (colour, group size, toddlers, wheelchair)
+    size = carriage.get('group_size', 0)
+    gid = carriage.get('group_id', 0)
+
+    if train.get('cancelled', False):
+        colour = '#ff4d4d'
+    elif train.get('party_train', False):
+        colour = '#add8e6' if i % 2 == 0 else '#ffb6c1'
+    elif train.get('school_name', ""):
+        colour = "#ddc446"
+    else:
+        colour = group_colour(gid) if size else EMPTY_COLOUR
+
+    return colour, size, carriage.get('toddlers', 0), bool(carriage.get('wheelchair', False))
+
+
+@lru_cache(maxsize=1024)
+def train_block(dep_time_24: str, tags: tuple, cells: tuple, show_toddlers: bool, show_wheelchair: bool) -> str:
+    # One train's heading and carriages as HTML, cached by exactly what it shows
+    tag_str = f" - {' | '.join(tags)}" if tags else ""
+    carriages = []
+    for i, (colour, size, toddlers, wheelchair) in enumerate(cells):
+        label = f"👥 {size}" if size else "Empty"
+        if show_toddlers and toddlers:
+            label += f"<br>👶 {toddlers}"
+        if show_wheelchair and wheelchair:
+            label += "<br>♿️"
+        carriages.append(
+            f'<div class="overview-carriage" style="background-color: {colour};"><b>C{i+1}</b><br>{label}</div>'
+        )
+
+    columns = max(len(cells), 8)
+    return (
+        f'<div class="overview-train"><h3>🚆 Train leaves at {format_24_to_12(dep_time_24)}{html.escape(tag_str)}</h3>'
+        f'<div class="overview-carriages" style="grid-template-columns: repeat({columns}, minmax(0, 1fr));">'
+        f'{"".join(carriages)}</div></div>'
+    )
 
-    def rgb_to_hex(rgb_tuple):
-        return '#{:02x}{:02x}{:02x}'.format(*rgb_tuple)
 
-    colour_map = {}
-    for i, gid in enumerate(group_ids):
-        rgb = tuple(int(c * 255) for c in cmap(i)[:3])
-        colour_map[gid] = rgb_to_hex(rgb)
+@st.fragment
+def edit_departure_time(service_date, train_ids):
+    # Departure time edits, one train at a time. Picking a train or a time reruns only this block.
+    schedule = load_schedule(service_date)
+    trains_by_id = {t['id']: t for t in schedule}
+    trains = [trains_by_id[train_id] for train_id in train_ids if train_id in trains_by_id]
+    if not trains:
+        return
 
-    return colour_map
+    with st.expander("✏️ Edit Departure Time"):
+        trains_by_label = {format_24_to_12(t['departure_time']): t for t in trains}
+        label = st.selectbox("Train", list(trains_by_label), key="edit_train")
+        train = trains_by_label[label]
+        dep_time_24 = train['departure_time']
+
+        current_time = datetime.strptime(dep_time_24, "%H:%M").time()
+        new_time = st.time_input(
+            "Edit Departure Time",
+            value=current_time,
+            key=f"time_input_{dep_time_24}",
+            step=timedelta(minutes=5)
+        )
+        new_time_24 = new_time.strftime("%H:%M")
+
+        if new_time_24 != dep_time_24:
+            conflict = any(
+                t['departure_time'] == new_time_24 and t != train for t in schedule
+            )
+            if conflict:
+                st.warning(f"⛔ A train already departs at {format_24_to_12(new_time_24)}.")
+            else:
+                if st.button("Confirm Update", key=f"confirm_update_{dep_time_24}"):
+                    actual_idx = schedule.index(train)
+                    schedule[actual_idx]['departure_time'] = new_time_24
+                    save_schedule(
+                        schedule, service_date, event="TrainTimeChanged",
+                        details={"from": dep_time_24, "to": new_time_24}
+                    )
+                    st.success(f"Time updated to {format_24_to_12(new_time_24)}.")
+                    # The grid shows the new time, so the whole page redraws
+                    st.rerun()
 
 
 def booking_overview_page():
     st.title("📊 Train Booking Overview")
 
-    schedule = load_schedule()
+    service_date = st.date_input("Service Date", value=today(), min_value=today(), key="overview_service_date")
+    schedule = load_schedule(service_date)
     if not schedule:
         st.info("No schedule data found.")
         return
 
-    # Sort schedule by 24h time
-    schedule.sort(key=lambda t: datetime.strptime(t['departure_time'], "%H:%M"))
-
-    group_colour_map = create_group_colour_map(schedule)
+    # Sort schedule by departure minute
+    schedule.sort(key=lambda t: t['departure_minute'])
 
     # Multiselect for 12-hour departure time filter
-    unique_times_24 = sorted({t['departure_time'] for t in schedule}, key=lambda x: datetime.strptime(x, "%H:%M"))
+    unique_times_24 = sorted({t['departure_time'] for t in schedule}, key=time_to_minute)
     time_map_24_to_12 = {t: format_24_to_12(t) for t in unique_times_24}
     time_map_12_to_24 = {v: k for k, v in time_map_24_to_12.items()}
 
@@ -82,103 +167,25 @@ def booking_overview_page():
         and (show_cancelled or not train.get('cancelled', False))
         and (show_party or not train.get('party_train', False))
         and (show_schools or not train.get('school_name', False))
-        and (show_previous or not has_departed(train['departure_time']))
+        and (show_previous or service_date > today() or not has_departed(train['departure_time']))
     ]
 
     if not filtered_trains:
         st.info("No trains match your filters.")
         return
 
-    for idx, train in enumerate(filtered_trains):
-        dep_time_24 = train['departure_time']
-        dep_time_12 = format_24_to_12(dep_time_24)
-        cancelled = train.get('cancelled', False)
-        party_train = train.get('party_train', False)
-        school_name = train.get('school_name', "")
-
-        tags = []
-        if cancelled:
-            tags.append("❌ CANCELLED")
-        if party_train:
-            tags.append("🎉 PARTY TRAIN")
-        if school_name:
-            tags.append(f"🏫🎓 {school_name}")
-
-        container = st.container()
-        with container:
-            cols = st.columns([9, 1])
-            with cols[0]:
-                tag_str = f" - {' | '.join(tags)}" if tags else ""
-                st.markdown(f"### 🚆 Train leaves at {dep_time_12}{tag_str}")
-            with cols[1]:
-                if st.button("Edit", key=f"edit_btn_{idx}"):
-                    st.session_state["edit_idx"] = idx
-
-            # Show time edit field
-            if st.session_state.get("edit_idx") == idx:
-                current_time = datetime.strptime(dep_time_24, "%H:%M").time()
-                new_time = st.time_input(
-                    "Edit Departure Time",
-                    value=current_time,
-                    key=f"time_input_{idx}",
-                    step=timedelta(minutes=5)
-                )
-                new_time_24 = new_time.strftime("%H:%M")
-
-                if new_time_24 != dep_time_24:
-                    conflict = any(
-                        t['departure_time'] == new_time_24 and t != train for t in schedule
-                    )
-                    if conflict:
-                        st.warning(f"⛔ A train already departs at {format_24_to_12(new_time_24)}.")
-                    else:
-                        if st.button("Confirm Update", key=f"confirm_update_{idx}"):
-                            actual_idx = schedule.index(train)
-                            schedule[actual_idx]['departure_time'] = new_time_24
-                            save_schedule(schedule)
-                            st.success(f"Time updated to {format_24_to_12(new_time_24)}.")
-                            del st.session_state["edit_idx"]
-                            st.rerun()
-
-            # Show carriages
-            carriage_cols = st.columns(8)
-            for i, carriage in enumerate(train['carriages']):
-                size = carriage.get('group_size', 0)
-                gid = carriage.get('group_id', 0)
-                toddlers = carriage.get('toddlers', 0)
-                wheelchair = carriage.get('wheelchair', False)
-
-                if cancelled:
-                    colour = '#ff4d4d'
-                elif party_train:
-                    colour = '#add8e6' if i % 2 == 0 else '#ffb6c1'
-                elif school_name:
-                    colour = "#ddc446"
-                else:
-                    colour = group_colour_map.get(gid, '#eee') if size else '#eee'
-
-                label = f"👥 {size}" if size else "Empty"
-                if show_toddlers and toddlers:
-                    label += f"\n👶 {toddlers}"
-                if show_wheelchair and wheelchair:
-                    label += "\n♿️"
-
-                with carriage_cols[i]:
-                    st.markdown(
-                        f"""
-                        <div style="
-                            background-color: {colour};
-                            border-radius: 10px;
-                            padding: 10px;
-                            text-align: center;
-                            min-height: 80px;
-                        ">
-                            <b>C{i+1}</b><br>{label.replace(chr(10), '<br>')}
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-            st.markdown("---")
+    # The whole grid goes out as one element; each train's block is only rebuilt when it changes
+    blocks = [
+        train_block(
+            train['departure_time'], train_tags(train),
+            tuple(carriage_cell(train, i, carriage) for i, carriage in enumerate(train['carriages'])),
+            show_toddlers, show_wheelchair
+        )
+        for train in filtered_trains
+    ]
+    st.markdown(GRID_CSS + "".join(blocks), unsafe_allow_html=True)
+
+    edit_departure_time(service_date, [t['id'] for t in filtered_trains])
 
     # Add new train
     st.subheader("➕ Add New Train")
@@ -213,12 +220,36 @@ def booking_overview_page():
                 ]
             }
             schedule.append(new_train)
-            save_schedule(schedule)
+            save_schedule(schedule, service_date, event="TrainAdded", details={"departure_time": new_time_24})
             st.success(f"Train at {format_24_to_12(new_time_24)} added.")
             st.rerun()
 
+    # Booking journal
+    with st.expander("🕘 Recent Changes"):
+        events = list_events(limit=20)
+        if not events:
+            st.info("No changes recorded yet.")
+        for event in events:
+            details = ", ".join(f"{k}: {v}" for k, v in event["details"].items())
+            st.write(f"{event['created_at'][:19].replace('T', ' ')} UTC - **{event['event_type']}** {details}")
+
+        if events and st.button("↩️ Undo Last Change"):
+            undone = undo_last_event()
+            if undone:
+                st.success(f"Undid {undone}.")
+                st.rerun()
+            else:
+                st.error("Nothing to undo, or the affected carriages have changed since.")
+
+    # Shared allocation decisions, to check the cache is earning its keep at busy times
+    with st.expander("⚙️ Allocation Cache"):
+        stats = decision_cache_stats()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+        col2.metric("Decisions stored", stats["size"])
+        col3.metric("Lookups", stats["hits"] + stats["misses"] + stats["uncached"])
+
 
 if __name__ == "__main__":
-    if "edit_idx" not in st.session_state:
-        st.session_state["edit_idx"] = None
-    booking_overview_page()
\ No newline at end of file
+    booking_overview_page()
+
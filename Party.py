@@ -1,7 +1,7 @@
 import streamlit as st
 import os
 from datetime import datetime
-from Code.Database import save_schedule, load_schedule
+from Code.Database import save_schedule, load_schedule, today
 from zoneinfo import ZoneInfo
 
 LOCAL = ZoneInfo("Europe/London")
@@ -17,10 +17,11 @@ def parse_time_local(time_str):
 def party_train_page():
     st.header("🎉 Party Trains")
 
-    schedule = load_schedule()
+    service_date = st.date_input("Service Date", value=today(), min_value=today(), key="party_service_date")
+    schedule = load_schedule(service_date)
 
-    # Sort trains by departure_time (e.g. "13:45") as datetime objects
-    schedule.sort(key=lambda x: parse_time_local(x['departure_time']))
+    # Sort trains by departure minute (e.g. "13:45" -> 825)
+    schedule.sort(key=lambda x: x['departure_minute'])
 
     for train in schedule:
         current_status = train.get("party_train", False)
@@ -28,12 +29,12 @@ def party_train_page():
         dep_str_12h = dep_dt.strftime("%I:%M %p").lstrip("0")  # convert to 12h format
 
         new_status = st.checkbox(
-            f"Mark train at {dep_str_12h} as a Party Train", value=current_status, key=dep_str_12h
+            f"Mark train at {dep_str_12h} as a Party Train", value=current_status, key=f"{service_date}_{dep_str_12h}"
         )
         train["party_train"] = new_status
 
     if st.button("Save Changes"):
-        save_schedule(schedule)
+        save_schedule(schedule, service_date, event="PartyTrainChanged")
         st.success("Party train settings updated.")
 
 if __name__ == "__main__":
@@ -1,7 +1,10 @@
 import streamlit as st
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from Code.Database import list_presets, load_preset, save_preset, delete_preset, save_schedule
+from Code.Database import (
+    list_presets, load_preset, save_preset, delete_preset, save_schedule, load_allocation_policy, save_allocation_policy, today
+)
+from Code.Policy import parse_policy, default_policy_text, load_policy, set_policy
 
 LOCAL = ZoneInfo("Europe/London")
 
@@ -36,6 +39,11 @@ def preset_schedule_page():
     st.subheader("📁 Load Existing Schedule Presets")
     presets = list_presets()
 
+    apply_date = st.date_input(
+        "Apply presets to date", value=today(), min_value=today(), key="preset_apply_date",
+        help="Loading a preset replaces the trains for this date only."
+    )
+
     if presets:
         for preset in presets:
             cols = st.columns([4, 1, 1])
@@ -47,11 +55,11 @@ def preset_schedule_page():
                     if new_schedule is None:
                         st.error(f"Preset '{preset}' not found in DB.")
                     else:
-                        save_schedule(new_schedule)
+                        save_schedule(new_schedule, apply_date, event="PresetApplied", details={"name": preset})
                         st.session_state.schedule = new_schedule
                         for key in ["confirm_c45", "feedback"]:
                             st.session_state.pop(key, None)
-                        st.success(f"Preset '{preset}' loaded and applied.")
+                        st.success(f"Preset '{preset}' loaded and applied to {apply_date.isoformat()}.")
                         st.rerun()
             with cols[2]:
                 if st.button("Delete", key=f"delete_{preset}"):
@@ -145,6 +153,37 @@ def preset_schedule_page():
     # Final save of schedule
     st.session_state.schedule = schedule
 
+    st.markdown("---")
+
+    # === Allocation Policy ===
+    st.subheader("⚙️ Allocation Policy")
+    st.caption("Which carriages each size of group is offered, in order. Changes apply to the next booking.")
+
+    override = load_allocation_policy()
+    policy_text = st.text_area(
+        "Policy (JSON)", value=override or default_policy_text(), height=400, key="allocation_policy_text"
+    )
+    if override:
+        st.info("Using a saved policy instead of the shipped one.")
+
+    cols = st.columns(2)
+    with cols[0]:
+        if st.button("Save Policy"):
+            try:
+                policy = parse_policy(policy_text)
+            except ValueError as e:
+                st.error(f"Policy not saved: {e}")
+            else:
+                save_allocation_policy(policy_text)
+                set_policy(policy)
+                st.success("Allocation policy saved.")
+    with cols[1]:
+        if st.button("Restore Shipped Policy", disabled=not override):
+            save_allocation_policy(None)
+            set_policy(load_policy())
+            st.session_state.pop("allocation_policy_text", None)
+            st.rerun()
+
 
 if __name__ == "__main__":
     preset_schedule_page()
\ No newline at end of file
@@ -1,9 +1,7 @@
 import streamlit as st
 import os
-import matplotlib
-import matplotlib.cm
 from datetime import datetime
-from Code.Database import save_schedule, load_schedule
+from Code.Database import load_schedule, load_train, remove_group, today
 from zoneinfo import ZoneInfo
 
 LOCAL = ZoneInfo("Europe/London")
@@ -15,87 +13,77 @@ def parse_time_local(time_str):
     )
     return dt
 
-def create_group_colour_map(schedule, cmap_name='tab20'):
-    group_ids = sorted({
-        carriage['group_id']
-        for train in schedule
-        for carriage in train['carriages']
-        if carriage.get('group_size', 0)
-    })
-    cmap = matplotlib.cm.get_cmap(cmap_name, len(group_ids))
-    return {
-        gid: f'rgb({int(cmap(i)[0]*255)}, {int(cmap(i)[1]*255)}, {int(cmap(i)[2]*255)})'
-        for i, gid in enumerate(group_ids)
-    }
+def remove_clicked(train_id, gid):
+    # Runs before the train's block redraws, so the block shows the carriages already cleared
+    if gid is not None:
+        # Clears every carriage holding this group through the group index
+        remove_group(gid)
+        st.session_state.removed_groups[train_id] = f"Removed group {gid} from entire schedule"
+
+@st.fragment
+def train_block(service_date, train_id):
+    # One train's carriage buttons. Clicks rerun only this block, against the cached schedule.
+    train = load_train(service_date, train_id)
+    if train is None:
+        return
+
+    dep_str_12h = parse_time_local(train['departure_time']).strftime("%I:%M %p").lstrip("0")
+    is_cancelled = train.get('cancelled', False)
+    is_party = train.get('party_train', False)
+
+    status_label = "❌ CANCELLED" if is_cancelled else ("🎉 PARTY TRAIN" if is_party else "")
+    st.subheader(f"⏰ {dep_str_12h} {status_label}")
+
+    removed_msg = st.session_state.removed_groups.pop(train_id, None)
+    if removed_msg:
+        st.success(removed_msg)
+
+    cols = st.columns(len(train['carriages']))
+    for i, carriage in enumerate(train['carriages']):
+        size = carriage.get('group_size', 0)
+        gid = carriage.get('group_id') if 'group_id' in carriage else None
+        toddlers = carriage.get('toddlers', 0)
+        wheelchair = carriage.get('wheelchair', False)
+
+        label = f"🚋 C{i+1}\n"
+        label += f"👥 {size}" if size else "Empty"
+        if gid is not None and size:
+            label += f"\n🆔 {gid}"
+            if toddlers:
+                label += f"\n👶 {toddlers}"
+            if wheelchair:
+                label += f"\n♿️"
+
+        btn_key = f"remove_train{train_id}_carriage{i}"
+
+        with cols[i]:
+            st.button(
+                label, key=btn_key, help="Click to remove this group",
+                on_click=remove_clicked, args=(train_id, gid if size > 0 else None)
+            )
 
 def remove_group_page():
+    if "removed_groups" not in st.session_state:
+        st.session_state.removed_groups = {}  # train id -> message about the group just removed
+
     st.title("🗑️ Remove Groups by Clicking")
 
-    schedule = load_schedule()
+    service_date = st.date_input("Service Date", value=today(), min_value=today(), key="remove_service_date")
+    schedule = load_schedule(service_date)
     if not schedule:
+        st.info("No schedule data found.")
         return
 
     show_past = st.checkbox("Show previous trains", value=False)
 
-    group_colour_map = create_group_colour_map(schedule)
-
-    removed_msg = None
     now = datetime.now(LOCAL).time()
 
-    for train_idx, train in enumerate(schedule):
-        dep_str = train['departure_time']
-        dep_dt = parse_time_local(dep_str)
-        dep_time = dep_dt.time()
-
-        # Format time to 12H with AM/PM, remove leading zero on hour
-        dep_str_12h = dep_dt.strftime("%I:%M %p").lstrip("0")
-
-        if not show_past and dep_time < now:
-            continue  # Skip past trains unless checkbox is ticked
-
-        is_cancelled = train.get('cancelled', False)
-        is_party = train.get('party_train', False)
-
-        status_label = "❌ CANCELLED" if is_cancelled else ("🎉 PARTY TRAIN" if is_party else "")
-        st.subheader(f"⏰ {dep_str_12h} {status_label}")
-
-        cols = st.columns(len(train['carriages']))
-        for i, carriage in enumerate(train['carriages']):
-            size = carriage.get('group_size', 0)
-            gid = carriage.get('group_id') if 'group_id' in carriage else None
-            toddlers = carriage.get('toddlers', 0)
-            wheelchair = carriage.get('wheelchair', False)
-
-            colour = group_colour_map.get(gid, '#eee') if size else '#eee'
-
-            label = f"🚋 C{i+1}\n"
-            label += f"👥 {size}" if size else "Empty"
-            if gid is not None and size:
-                label += f"\n🆔 {gid}"
-                if toddlers:
-                    label += f"\n👶 {toddlers}"
-                if wheelchair:
-                    label += f"\n♿️"
-
-            btn_key = f"remove_train{train_idx}_carriage{i}"
-
-            with cols[i]:
-                if st.button(label, key=btn_key, help="Click to remove this group"):
-                    if size > 0 and gid is not None:
-                        # Remove all carriages with this group_id in entire schedule
-                        for t in schedule:
-                            for c in t['carriages']:
-                                if c.get('group_id') == gid:
-                                    c['group_size'] = 0
-                                    c['occupied'] = False
-                                    c['group_id'] = 0
-                                    c['toddlers'] = 0
-                                    c['wheelchair'] = False
-                        save_schedule(schedule)
-                        removed_msg = f"Removed group {gid} from entire schedule"
-                        st.rerun()
+    for train in schedule:
+        # Skip past trains unless checkbox is ticked; every train on a later day is still to come
+        if not show_past and service_date == today() and parse_time_local(train['departure_time']).time() < now:
+            continue
 
-    if removed_msg:
-        st.success(removed_msg)
+        train_block(service_date, train['id'])
 
-remove_group_page()
\ No newline at end of file
+if __name__ == "__main__":
+    remove_group_page()
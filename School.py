@@ -1,7 +1,7 @@
 import streamlit as st
 import os
 from datetime import datetime
-from Code.Database import save_schedule, load_schedule
+from Code.Database import save_schedule, load_schedule, today
 
 def format_time_12h(time_24h):
     dt = datetime.strptime(time_24h, "%H:%M")
@@ -10,9 +10,10 @@ def format_time_12h(time_24h):
 def school_train_page():
     st.header("🏫 School Trains")
 
-    schedule = load_schedule()
-    # Sort by departure_time as datetime object for consistency
-    schedule.sort(key=lambda t: datetime.strptime(t["departure_time"], "%H:%M"))
+    service_date = st.date_input("Service Date", value=today(), min_value=today(), key="school_service_date")
+    schedule = load_schedule(service_date)
+    # Sort by departure minute for consistency
+    schedule.sort(key=lambda t: t["departure_minute"])
 
     for idx, train in enumerate(schedule):
         dep_12h = format_time_12h(train['departure_time'])
@@ -21,7 +22,7 @@ def school_train_page():
             unsafe_allow_html=True
         )
 
-        input_key = f"school_{idx}"
+        input_key = f"school_{service_date}_{idx}"
         current_val = st.session_state.get(input_key, train.get("school_name", ""))
 
         new_name = st.text_input(
@@ -36,7 +37,7 @@ def school_train_page():
         st.markdown("---")
 
     if st.button("💾 Save School Trains"):
-        save_schedule(schedule)
+        save_schedule(schedule, service_date, event="SchoolTrainChanged")
         st.success("School train data saved.")
 
 if __name__ == "__main__":
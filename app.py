@@ -1,16 +1,46 @@
+import importlib
 import streamlit as st
 from streamlit_option_menu import option_menu
-from Booking import booking_page
-from Overview import booking_overview_page
-from Cancel import train_cancel_page
-from RemoveGroup import remove_group_page
-from Manual import manual_group_assignment_page
-from Party import party_train_page
-from Presets import preset_schedule_page
-from School import school_train_page
-from Information import information_page
+from Code.Database import migrate_database, load_allocation_policy
+from Code.Policy import load_policy, set_policy
+
+# Menu entry -> (module, page function, icon). A page's module is only imported the first time
+# the page is shown, so starting the app doesn't pay for pages nobody opens.
+PAGES = {
+    "Booking": ("Booking", "booking_page", "book"),
+    "Overview": ("Overview", "booking_overview_page", "list-task"),
+    "Information": ("Information", "information_page", "info-circle"),
+    "Manual Booking": ("Manual", "manual_group_assignment_page", "person"),
+    "Batch Booking": ("Batch", "batch_booking_page", "people"),
+    "Remove Groups": ("RemoveGroup", "remove_group_page", "trash"),
+    "Remove Train Times": ("Cancel", "train_cancel_page", "x-circle"),
+    "Party Train": ("Party", "party_train_page", "gift"),
+    "School Train": ("School", "school_train_page", "building"),
+    "Schedule Presets": ("Presets", "preset_schedule_page", "gear"),
+    "Departure Board": ("Kiosk", "departure_board_page", "display"),
+}
+
+# Platform screens open the app with ?kiosk=1 to get the departure board and nothing else
+KIOSK_PAGE = "Departure Board"
+
+@st.cache_resource
+def start_up():
+    # Upgrade the database before any page touches it, then compile the allocation policy it may
+    # override. Once per server process rather than on every rerun.
+    migrate_database()
+    set_policy(load_policy(load_allocation_policy()))
+
+def load_page(name):
+    module_name, function_name, _ = PAGES[name]
+    return getattr(importlib.import_module(module_name), function_name)
 
 def main():
+    start_up()
+
+    if st.query_params.get("kiosk") == "1":
+        load_page(KIOSK_PAGE)()
+        return
+
     # Initialize counter in session state if not already present
     if "diggers_sold" not in st.session_state:
         st.session_state.diggers_sold = 0
@@ -19,11 +49,8 @@ def main():
     with st.sidebar:
         selected_page = option_menu(
             menu_title="Main Menu",
-            options=[
-                "Booking", "Overview", "Information","Manual Booking", "Remove Groups",
-                "Remove Train Times", "Party Train", "School Train", "Schedule Presets"
-            ],
-            icons=["book", "list-task", "info-circle", "person", "trash", "x-circle", "gift", "building", "gear"],
+            options=list(PAGES),
+            icons=[icon for _, _, icon in PAGES.values()],
             menu_icon="cast",
             default_index=0,
             orientation="vertical",
@@ -52,24 +79,7 @@ def main():
         st.rerun()
 
     # Route to the correct page
-    if selected_page == "Booking":
-        booking_page()
-    elif selected_page == "Overview":
-        booking_overview_page()
-    elif selected_page == "Information":
-        information_page()
-    elif selected_page == "Remove Train Times":
-        train_cancel_page()
-    elif selected_page == "Remove Groups":
-        remove_group_page()
-    elif selected_page == "Manual Booking":
-        manual_group_assignment_page()
-    elif selected_page == "Party Train":
-        party_train_page()
-    elif selected_page == "Schedule Presets":
-        preset_schedule_page()
-    elif selected_page == "School Train":
-        school_train_page()
+    load_page(selected_page)()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
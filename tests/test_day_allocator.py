@@ -0,0 +1,99 @@
+import itertools
+import random
+from copy import deepcopy
+
+import pytest
+
+from Code import WC as wc
+from Code.SmallGroup import SmallGroupHandler
+from Code.MediumGroup import MediumGroupHandler
+from Code.LargeGroups import LargeGroupHandler
+from Code.DayAllocator import allocator_for
+from Code.Policy import load_policy
+from Code.allocation.options import AllocationOptions
+
+# The shipped policy, so the test never reads the database
+POLICY = load_policy()
+HANDLERS = {"small": SmallGroupHandler, "medium": MediumGroupHandler, "large": LargeGroupHandler}
+
+# The standard train, with a few larger carriages mixed in at random
+LAYOUT = [("1", 2), ("2", 4), ("3", 4), ("4", 2), ("5", 2), ("6", 4), ("7", 4), ("8", 2)]
+DAYS_PER_SEED = 40
+
+_train_ids = itertools.count(1)
+
+def random_train(rng):
+    carriages = []
+    for position, (number, capacity) in enumerate(LAYOUT):
+        carriage = {
+            "id": position + 1,
+            "number": number,
+            "position": position,
+            "capacity": rng.choice([capacity, capacity, 6]),
+            "occupied": rng.random() < rng.choice([0.2, 0.5, 0.8]),
+            "group_size": 0,
+            "toddlers": 0,
+            "wheelchair": False,
+            "group_id": 0,
+        }
+        # Some carriages carry their own accessibility, the rest fall back to the defaults by number
+        if rng.random() < 0.3:
+            carriage["accessible"] = rng.random() < 0.5
+            carriage["wheelchair_capacity"] = rng.randint(0, carriage["capacity"])
+        carriages.append(carriage)
+    # Unique ids, so WC's occupancy registry never mixes up two random trains
+    return {
+        "id": next(_train_ids), "departure_time": "12:00", "departure_minute": 720,
+        "cancelled": False, "party_train": False, "school_name": "", "carriages": carriages,
+    }
+
+def random_group(rng, wheelchair_count):
+    size = rng.randint(max(1, wheelchair_count), 12)
+    adults = rng.randint(0, size)
+    return {
+        "adults": adults,
+        "children": size - adults,
+        "toddlers": rng.randint(0, min(adults, 2)),
+        "wheelchair_count": wheelchair_count,
+    }
+
+def handler_places(train, group, options, answer):
+    # Whether the per-size handlers seat the group on a copy of the train, answering their questions with `answer`
+    placed = deepcopy(train)
+    size = group["adults"] + group["children"]
+    if group["wheelchair_count"] > 0:
+        return wc.WC.wheelchair(group["wheelchair_count"], size, group["adults"], group["toddlers"], [placed], -1)
+
+    handler_class = HANDLERS[POLICY.band_for(size).handler]
+    handler = handler_class(
+        group={"size": size, "toddlers": group["toddlers"]},
+        adults=group["adults"],
+        carriages=placed["carriages"],
+        train=placed,
+        group_id=-1,
+        confirmation_callback=lambda t, c: answer,
+        options=options,
+    )
+    return handler.assign()
+
+@pytest.mark.parametrize("no_1_4_5_8", [False, True])
+@pytest.mark.parametrize("wheelchair_count", [0, 1, 2])
+@pytest.mark.parametrize("seed", range(5))
+def test_screen_keeps_every_train_the_handlers_accept(seed, wheelchair_count, no_1_4_5_8):
+    rng = random.Random(seed * 100 + wheelchair_count * 10 + no_1_4_5_8)
+    options = AllocationOptions(no_1_4_5_8_for_group=no_1_4_5_8, policy=POLICY)
+    placed = 0
+
+    for _ in range(DAYS_PER_SEED):
+        trains = [random_train(rng) for _ in range(rng.randint(1, 10))]
+        group = random_group(rng, wheelchair_count)
+        size = group["adults"] + group["children"]
+        candidates = allocator_for(trains).candidate_trains(size, group["adults"], wheelchair_count, policy=POLICY)
+
+        for index, train in enumerate(trains):
+            if any(handler_places(train, group, options, answer) for answer in (True, False)):
+                placed += 1
+                assert index in candidates, (index, group, train["carriages"])
+
+    # The layouts must leave the handlers something to place, or the check proves nothing
+    assert placed > 0